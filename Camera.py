@@ -1,6 +1,7 @@
 from Matrix import ViewMatrix, ProjectionMatrix
 from Shader import Shader3D
 from Vec import Vec, numeral
+from Culling import Frustum
 
 
 # Used to have ideal getter / setter for camera pos property
@@ -45,7 +46,9 @@ class Camera:
 		self.shader = shader
 		self.shader.set_view_matrix(self.view.get_matrix())
 		self.shader.set_projection_matrix(self.projection.get_matrix())
-		self.shader.set_fog(Vec(0.2, 0.2, 0.2), 10, 30)
+		self.fog_end = 30  # Everything further away is fully fogged, so it's culled too
+		self.shader.set_fog(Vec(0.2, 0.2, 0.2), 10, self.fog_end)
+		self.frustum = Frustum()
 
 	@property
 	def pos(self):
@@ -58,6 +61,10 @@ class Camera:
 		self.shader.set_view_matrix(self.view.get_matrix())
 		self.shader.set_camera_position(self.view.eye)
 
+	def update_frustum(self) -> Frustum:  # Call once per frame before culling, after the camera has moved
+		self.frustum.update(self.projection.get_matrix(), self.view.get_matrix(), self.view.eye, self.fog_end)
+		return self.frustum
+
 	def look(self, target: Vec, up: Vec = None):
 		self.view.look(self.view.eye, target, Vec.up() if up is None else up)
 		self.shader.set_view_matrix(self.view.get_matrix())
@@ -3,24 +3,87 @@ from Vec import Vec
 from Shader import Shader3D
 from game_resources import look
 
+import numpy as np
+
 
 # Encapsulates a game object's coordinate frame
 class Coord:
+	# Totals for every coordinate frame, how many local matrices were rebuilt or reused since reset_counters
+	total_rebuilds = 0
+	total_reuses = 0
+
 	def __init__(self, model: ModelMatrix, shader: Shader3D, pos: Vec = None, scale: Vec = None, rotation: Vec = None):
 		self.model = model
 		self.shader = shader
+		self.__local = np.identity(4, np.float32)  # Cached translation * orientation * rotation * scale
+		self.__dirty = True
+		self.__key: tuple | None = None
+		self.rebuilds = 0
+		self.reuses = 0
 		self.pos = Vec() if pos is None else pos
 		self.scalar = Vec.one() if scale is None else scale
 		self.rotation = Vec() if rotation is None else rotation
 		self.orientation: list[int | float] | None = None
 
+	# Assigning any part of the transform marks the local matrix dirty
+	@property
+	def pos(self) -> Vec:
+		return self.__pos
+
+	@pos.setter
+	def pos(self, pos: Vec):
+		self.__pos = pos
+		self.__dirty = True
+
+	@property
+	def scalar(self) -> Vec:
+		return self.__scalar
+
+	@scalar.setter
+	def scalar(self, scalar: Vec):
+		self.__scalar = scalar
+		self.__dirty = True
+
+	@property
+	def rotation(self) -> Vec:
+		return self.__rotation
+
+	@rotation.setter
+	def rotation(self, rotation: Vec):
+		self.__rotation = rotation
+		self.__dirty = True
+
+	@property
+	def orientation(self) -> list[int | float] | None:
+		return self.__orientation
+
+	@orientation.setter
+	def orientation(self, orientation: list[int | float] | None):
+		self.__orientation = orientation
+		self.__dirty = True
+
+	@classmethod
+	def reset_counters(cls):
+		cls.total_rebuilds = 0
+		cls.total_reuses = 0
+
+	def local_matrix(self) -> np.ndarray:  # Only rebuilt when the transform has changed since last time
+		# Components are compared as well since Vecs can be changed in place, e.g. pos.z = 0
+		key = (*self.__pos, *self.__scalar, *self.__rotation)
+		if not self.__dirty and key == self.__key:
+			self.reuses += 1
+			Coord.total_reuses += 1
+			return self.__local
+
+		ModelMatrix.compose(self.__pos, self.__rotation, self.__scalar, self.__orientation, self.__local)
+		self.__dirty, self.__key = False, key
+		self.rebuilds += 1
+		Coord.total_rebuilds += 1
+		return self.__local
+
 	def apply(self):
 		self.model.push_matrix()
-		self.model.translate(self.pos)
-		if self.orientation is not None:
-			self.model.transform(self.orientation)
-		self.model.rotate(self.rotation)
-		self.model.scale(self.scalar)
+		self.model.multiply(self.local_matrix())
 		self.shader.set_model_matrix(self.model.get_matrix())
 
 	def unapply(self):
@@ -0,0 +1,48 @@
+from Vec import Vec
+from Visibility import VisibilityGrid
+
+import numpy as np
+
+
+# Planes of the camera's view volume, boxes outside of it or further away than far aren't drawn.
+# With a visibility grid, neither are boxes in cells that can't be seen from the eye's cell.
+class Frustum:
+	def __init__(self):
+		self.planes = np.zeros((6, 4), np.float32)  # [a, b, c, d] with normals pointing inwards
+		self.eye = np.zeros(3, np.float32)
+		self.far: float | None = None
+		self.visibility: VisibilityGrid | None = None
+		self.culled = 0  # Boxes tested since end_frame
+		self.drawn = 0
+		self.frame_stats = {"culled": 0, "drawn": 0}  # Counters of last finished frame
+
+	# Extracts planes from projection * view, both row-major. far is a distance from eye, e.g. where fog is solid
+	def update(self, projection: np.ndarray, view: np.ndarray, eye: Vec, far: float = None):
+		m = projection @ view
+		self.planes[:] = (m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2])
+		self.planes /= np.linalg.norm(self.planes[:, :3], axis=1, keepdims=True)
+		self.eye[:] = [*eye]
+		self.__eye = Vec(*eye)
+		self.far = far
+
+	def visible_batch(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:  # Mask of (N, 3) boxes lo - hi at least partly inside
+		lo, hi = np.atleast_2d(lo), np.atleast_2d(hi)
+		normals, d = self.planes[:, :3], self.planes[:, 3]
+		# Corner of each box furthest along each plane's normal, box is outside if that corner is behind the plane
+		corners = np.where(normals[None] >= 0, hi[:, None], lo[:, None])
+		mask = np.all(np.einsum("npk,pk->np", corners, normals) + d >= 0, axis=1)
+		if self.far is not None:  # Distance from eye to closest point of box
+			mask &= np.linalg.norm(np.maximum(np.maximum(lo - self.eye, self.eye - hi), 0), axis=1) <= self.far
+		if self.visibility is not None:
+			mask &= self.visibility.boxes_visible(lo, hi, self.__eye)
+		drawn = int(np.count_nonzero(mask))
+		self.drawn += drawn
+		self.culled += len(mask) - drawn
+		return mask
+
+	def visible(self, lo, hi) -> bool:
+		return bool(self.visible_batch(lo, hi)[0])
+
+	def end_frame(self):  # Stores counters of the frame in frame_stats and starts counting again
+		self.frame_stats = {"culled": self.culled, "drawn": self.drawn}
+		self.culled = self.drawn = 0
@@ -0,0 +1,166 @@
+from Vec import Vec
+from Navigation import FlowField
+from Spatial import SpatialGrid
+from Visibility import LineOfSight, VisibilityGrid
+
+import numpy as np
+
+
+# Every imp of the level simulated together, state is kept in arrays indexed by enemy instead of one object each.
+# Imps close enough to see the player walk towards them, pushed apart from each other and out of walls,
+# imps within reach attack instead. The rest idle. With a flow field imps walk around walls along it,
+# otherwise straight at the player. Imps that have seen the player stay alert and keep chasing while close enough,
+# also once out of sight.
+class EnemySwarm:
+	FRAMES = ("idle", "attack", "walk0", "walk1", "walk2")  # Sprite frame of each state code
+	IDLE, ATTACK, WALK = 0, 1, 2  # Walk cycle is WALK, WALK + 1 and WALK + 2
+
+	def __init__(self, positions: list[Vec], scale: Vec, walls: SpatialGrid, visibility: VisibilityGrid = None,
+				 radius: float = 0.2, speed: float = 1.5, detection_radius: float = 10, flow: FlowField = None,
+				 sight: LineOfSight = None):
+		self.positions = np.array([[*pos] for pos in positions], np.float64).reshape(-1, 3)
+		self.scale = np.array([*scale], np.float64)
+		self.frames = np.full(len(self.positions), self.IDLE, np.int8)
+		self.walls = walls
+		self.visibility = visibility
+		self.radius = radius
+		self.speed = speed
+		self.detection_radius = detection_radius
+		self.flow = flow
+		self.sight = sight
+		self.alert = np.zeros(len(self.positions), bool)  # Have seen the player since last out of reach
+		# Imps keep this far apart, their footprint as in GameHandler.collide_objects, but round
+		self.spacing = min(self.scale[0], self.scale[2]) / 2 + radius
+		self.distances = np.zeros(len(self.positions))  # To the player, as of last step
+		self.pairs = 0  # Overlapping pairs pushed apart in last step
+		self.__grid: SpatialGrid | None = None  # Of imp boxes for raycasts, rebuilt after imps move
+
+	def __len__(self) -> int:
+		return len(self.positions)
+
+	# Moves imps for a frame towards eye and picks their states, returns how many are attacking.
+	# tick marks an AI tick: the walk cycle of walking imps advances and the flow field follows eye to its cell,
+	# in between frames stay and imps keep following the field as it was.
+	def step(self, eye: Vec, delta_time: float, tick: bool = False) -> int:
+		if self.flow is not None and (tick or self.flow.target < 0):
+			self.flow.update(eye)
+		eye = np.array([*eye], np.float64)
+		self.distances = np.linalg.norm(self.positions - eye, axis=1)
+		attacking = self.distances <= 4 * self.radius  # Within attack range
+		near = self.distances <= self.detection_radius
+		self.alert &= near
+		looking = near & ~attacking & ~self.alert  # Player has to be close enough and not hidden behind walls
+		if self.visibility is not None and looking.any():  # Cheap first, cells that can't see each other
+			looking[looking] = self.visibility.sees_batch(Vec(*eye), self.positions[looking])
+		if self.sight is not None and looking.any():
+			indices = np.flatnonzero(looking)
+			looking[indices] = self.sight.sees_batch(Vec(*eye), self.positions[indices], indices)
+		self.alert |= looking
+		chasing = ~attacking & self.alert
+
+		movers = np.flatnonzero(chasing)
+		old = self.positions[movers]
+		offsets = eye - old
+		if self.flow is not None:  # Same pace along the field, straight on in the player's cell or off the field
+			directions = self.flow.sample(old)
+			along = directions.any(axis=1)
+			pace = np.linalg.norm(offsets[along][:, [0, 2]], axis=1, keepdims=True)
+			offsets[np.ix_(along, [0, 2])] = directions[along] * pace
+		new = old + offsets * self.speed * delta_time  # Move towards player, faster when further away
+		new = self.separate(movers, new)
+		self.positions[movers] = self.walls.collide_batch(old, new, self.radius)
+		if len(movers):
+			self.__grid = None
+
+		if tick:  # Next frame in walk cycle, or first frame if not yet walking
+			frames = self.frames[chasing]
+			self.frames[chasing] = np.where(frames >= self.WALK, self.WALK + (frames - self.WALK + 1) % 3, self.WALK)
+		self.frames[attacking] = self.ATTACK
+		self.frames[~attacking & ~chasing] = self.IDLE
+		return int(np.count_nonzero(attacking))
+
+	# Pushes movers at new positions out of imps closer than spacing on the floor plan. Imps are sorted into grid cells
+	# as large as spacing, so only imps in the same or neighbouring cells are compared. Imps standing still don't give way.
+	def separate(self, movers: np.ndarray, new: np.ndarray) -> np.ndarray:
+		if not len(movers):
+			self.pairs = 0
+			return new
+		positions = self.positions[:, [0, 2]].copy()
+		positions[movers] = new[:, [0, 2]]
+		moving = np.zeros(len(positions), bool)
+		moving[movers] = True
+
+		cells = np.floor(positions / self.spacing).astype(np.int64)
+		cells -= cells.min(axis=0) - 1  # Leaves a free row and column around every cell, neighbours never wrap
+		rows = int(cells[:, 1].max()) + 2
+		order = np.argsort(cells[:, 0] * rows + cells[:, 1], kind="stable")
+		keys = (cells[:, 0] * rows + cells[:, 1])[order]
+		index = np.arange(len(keys))
+		firsts, seconds = [], []
+		for dx, dz in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):  # Half the neighbours, so each pair comes up once
+			start = np.searchsorted(keys, keys + dx * rows + dz, side="left")
+			end = np.searchsorted(keys, keys + dx * rows + dz, side="right")
+			if dx == dz == 0:
+				start = index + 1  # Same cell, only imps after this one
+			counts = np.maximum(end - start, 0)
+			firsts.append(np.repeat(index, counts))
+			seconds.append(np.repeat(start, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+		a, b = order[np.concatenate(firsts)], order[np.concatenate(seconds)]
+
+		keep = moving[a] | moving[b]
+		a, b = a[keep], b[keep]
+		offsets = positions[b] - positions[a]
+		dist = np.linalg.norm(offsets, axis=1)
+		close = dist < self.spacing
+		a, b, offsets, dist = a[close], b[close], offsets[close], dist[close]
+		self.pairs = len(a)
+		if not len(a):
+			return new
+
+		# Push along the line between imps, or along x when they're on top of each other
+		directions = np.where(dist[:, None] > 0, offsets / np.maximum(dist, 1e-9)[:, None], (1.0, 0.0))
+		overlap = self.spacing - dist
+		share_a = np.where(moving[b], 0.5, 1.0) * moving[a]  # Moving imps share the push, a still one takes none
+		share_b = np.where(moving[a], 0.5, 1.0) * moving[b]
+		push = directions * overlap[:, None]
+		for axis, column in ((0, 0), (2, 1)):  # Summed per imp, an imp can overlap several others
+			total = np.bincount(b, push[:, column] * share_b, len(positions)) - np.bincount(a, push[:, column] * share_a, len(positions))
+			new[:, axis] += total[movers]
+		return new
+
+	# Nearest imp each of N rays hits within max_dist, imps behind walls are safe. Imps are boxes as large as their
+	# sprites, kept in a grid like the walls so each ray only tests imps in cells it passes through. Returns (N,)
+	# distances to whatever each ray hit first, np.inf if nothing, and (N,) indices of imps hit, -1 where a wall or nothing was hit.
+	def raycast_batch(self, origins: np.ndarray, directions: np.ndarray, max_dist: float) -> tuple[np.ndarray, np.ndarray]:
+		distances, _ = self.walls.raycast_batch(origins, directions, max_dist)
+		return self.__nearest(self.grid().raycast_batch(origins, directions, max_dist), distances)
+
+	def raycast(self, origin: Vec, direction: Vec, max_dist: float) -> tuple[float, int]:  # Single ray, see raycast_batch
+		distance, _ = self.walls.raycast(origin, direction, max_dist)
+		t, hit = self.grid().raycast(origin, direction, max_dist)
+		distances, hits = self.__nearest((np.array([t]), np.array([hit])), np.array([distance]))
+		return float(distances[0]), int(hits[0])
+
+	def grid(self) -> SpatialGrid:
+		if self.__grid is None:
+			half = self.scale / 2
+			self.__grid = SpatialGrid(range(len(self.positions)), self.walls.cell_size, (self.positions - half, self.positions + half))
+		return self.__grid
+
+	@staticmethod
+	def __nearest(imps: tuple[np.ndarray, np.ndarray], distances: np.ndarray):  # Imps hit before distances, the walls each ray hit
+		t, hits = imps
+		first = t < distances  # Imp is in front of any wall the ray hits
+		return np.where(first, t, distances), np.where(first, hits, -1)
+
+	def remove(self, indices):
+		keep = np.ones(len(self.positions), bool)
+		keep[indices] = False
+		self.positions, self.frames, self.distances, self.alert = self.positions[keep], self.frames[keep], self.distances[keep], self.alert[keep]
+		if self.sight is not None:
+			self.sight.remove(indices)
+		self.__grid = None
+
+	def instances(self, frame_indices: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+		# Positions, scales and frames for SpriteBatch.submit, frame_indices maps state codes to the batch's frames
+		return self.positions, np.broadcast_to(self.scale, self.positions.shape), frame_indices[self.frames]
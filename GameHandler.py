@@ -4,12 +4,20 @@ from pygame.locals import *
 from OpenGL.GL import *
 
 from Vec import Vec
+from RenderTarget import RenderTarget, ResolutionScaler
+
+import time
 
 
 # Defines class which Handles game loop
 class GenericGameHandler:
-	def __init__(self, x_bounds, y_bounds, desired_fps, bg_color=(0.2, 0.2, 0.2, 1.0)):
+	# depth_prepass asks subclasses to draw opaque objects depth only first, see RenderQueue
+	# With dynamic_resolution, display draws offscreen at a scale between min_scale and max_scale picked to hold
+	# desired_fps, then it's stretched over the window and display_hud draws on top at full resolution
+	def __init__(self, x_bounds, y_bounds, desired_fps, bg_color=(0.2, 0.2, 0.2, 1.0), depth_prepass=False,
+				 dynamic_resolution=False, min_scale=0.5, max_scale=1.0):
 		self.bounds = Vec(x_bounds, y_bounds)
+		self.depth_prepass = depth_prepass
 		self.fps = desired_fps
 		self.delta_time = 0
 		self.clock = pg.time.Clock()
@@ -25,6 +33,11 @@ class GenericGameHandler:
 		glEnable(GL_BLEND)
 		glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+		self.render_target = RenderTarget(self.bounds) if dynamic_resolution else None
+		self.scaler = ResolutionScaler(1 / desired_fps, min_scale, max_scale) if dynamic_resolution else None
+		if self.render_target is not None:
+			self.render_target.scale = self.scaler.scale
+
 	def quit(self):  # Quits game
 		pg.quit()
 		quit()
@@ -37,9 +50,16 @@ class GenericGameHandler:
 
 	def __display_start(self):  # Runs OpenGL display header
 		glEnable(GL_DEPTH_TEST)
+		if self.render_target is not None:
+			self.render_target.bind()
+		else:
+			glViewport(0, 0, self.bounds.x, self.bounds.y)
 		glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
 
-		glViewport(0, 0, self.bounds.x, self.bounds.y)
+	def __display_hud(self):  # Brings scaled frame to the window before the HUD is drawn over it
+		if self.render_target is not None:
+			self.render_target.resolve()
+		self.display_hud()
 
 	def __display_end(self):  # Runs OpenGL display footer
 		pg.display.flip()
@@ -47,6 +67,9 @@ class GenericGameHandler:
 	def display(self):  # What happens when game state should be drawn, Defined by subclass
 		pass
 
+	def display_hud(self):  # What is drawn over the game at full resolution, Defined by subclass
+		pass
+
 	def loop(self):  # Game loop
 		# Ensures delta time is reasonable value by time program is running
 		self.delta_time = self.clock.tick(10000) / 1000
@@ -55,6 +78,11 @@ class GenericGameHandler:
 			self.delta_time = self.clock.tick(self.fps) / 1000
 			self.update_input()
 			self.update()
+			start = time.perf_counter()  # Time spent drawing, game logic and the wait for vsync in flip don't depend on resolution
 			self.__display_start()
 			self.display()
+			self.__display_hud()
+			if self.scaler is not None:
+				glFinish()  # Waits for the GPU, otherwise only the time to queue up the draws is measured
+				self.render_target.scale = self.scaler.update(time.perf_counter() - start)
 			self.__display_end()
\ No newline at end of file
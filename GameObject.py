@@ -1,22 +1,47 @@
-from OpenGL.GL import *
-
-from Lighting import Material
+from Lighting import Material, bake_lights
 
 from Coord import Coord
 
-from Matrix import ModelMatrix
+from Matrix import ModelMatrix, billboard_batch
 
 from Shader import Shader3D
 
 from Vec import Vec
 
+from Geometry import GeometryBuffer, InstanceBuffer
+
+from Culling import Frustum
+
 import numpy as np
 
 import json
+import hashlib
+import os
+
+
+# Unit cube shared by Cube and Sprite, 6 faces of 4 points each
+UNIT_CUBE_POINTS = (
+	-0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5, -0.5,
+	-0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5, 0.5,
+	-0.5, -0.5, -0.5, 0.5, -0.5, -0.5, 0.5, -0.5, 0.5, -0.5, -0.5, 0.5,
+	-0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, 0.5, 0.5, -0.5, 0.5, 0.5,
+	-0.5, -0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5,
+	0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5)
+
+UNIT_CUBE_NORMALS = (
+	0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0,
+	0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0,
+	0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0,
+	0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0,
+	-1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0,
+	1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
 
 
 # Stores information needed to store, move, animate, and draw game objects
 class GameObject:
+	max_lights: int | None = None  # Most lights picked per draw, None for as many as the shader takes
+	baked = False  # Whether static lights are baked into the object's vertices
+
 	def __init__(self, model: ModelMatrix, shader: Shader3D, pos=None, scale=None, rotation=None, material=None, tiling=(1,1)):
 		self.coord = Coord(model, shader, pos, scale, rotation)
 		self.material = Material() if material is None else material
@@ -34,14 +59,35 @@ class GameObject:
 	def steps(self):  # How many points per face of object, defined by subclass
 		pass
 
-	# Passes object positions and normals to shader
-	def set(self):
-		self.coord.shader.set_position_attribute(self.points())
-		self.coord.shader.set_normal_attribute(self.normals())
-		uv = np.array(self.uv())
-		uv[::2] *= self.tiling[0]
-		uv[1::2] *= self.tiling[1]
-		self.coord.shader.set_uv_attribute(uv)
+	def uv_rect(self):  # Part of the bound texture object is drawn with, [u offset, v offset, u scale, v scale]
+		return [0.0, 0.0, 1.0, 1.0]
+
+	def geometry_key(self):  # Objects with equal keys share the same GPU buffers
+		return type(self)
+
+	def build_geometry(self) -> GeometryBuffer:  # Uploads points, normals and uv coordinates to the GPU
+		return GeometryBuffer.from_faces(self.points(), self.normals(), self.uv(), self.steps())
+
+	def geometry(self) -> GeometryBuffer:
+		return GeometryBuffer.shared(self.geometry_key(), self.build_geometry)
+
+	def bounds(self) -> tuple[np.ndarray, np.ndarray]:  # World space box around object, lights are picked by it
+		world = self.coord.model.matrix @ self.coord.local_matrix()
+		extent = 0.5 * np.abs(world[:3, :3]).sum(axis=1)  # Unit cube corners pushed through the matrix
+		return world[:3, 3] - extent, world[:3, 3] + extent
+
+	def cull(self, frustum: Frustum) -> bool:  # Whether any of the object is in view
+		return frustum.visible(*self.bounds())
+
+	def pick_lights(self) -> np.ndarray:  # Lights the object is drawn with, see Shader3D.pick_lights
+		return self.coord.shader.pick_lights(*self.bounds(), self.max_lights, self.baked)
+
+	# Uses lights, picked here unless they already were, binds object's geometry and passes texture tiling to shader
+	def set(self, lights: np.ndarray = None):
+		self.coord.shader.use_lights(self.pick_lights() if lights is None else lights, self.baked)
+		self.geometry().bind()
+		self.coord.shader.set_uv_scale(self.tiling)
+		self.coord.shader.set_uv_rect(self.uv_rect())
 
 	# Draws with push pop
 	def draw(self):
@@ -50,53 +96,43 @@ class GameObject:
 		self.coord.unapply()
 
 	# Sets before drawing
-	def draw_set(self):
-		self.set()
+	def draw_set(self, lights: np.ndarray = None):
+		self.set(lights)
 		self.draw()
 
 	# Draws object from its points and with its color
 	def raw_draw(self):
 		self.coord.shader.set_material(*self.material)
-
-		end, step = len(self.points()) // 3, self.steps()
-		for x in range(0, end, step):
-			glDrawArrays(GL_TRIANGLE_FAN, x, step)
+		self.geometry().draw()
 
 
 class Sprite(GameObject):  # Collection of rectangles ;)
-	def __init__(self, model: ModelMatrix, shader: Shader3D, pos=None, scale=None, rotation=None, material=None, tiling=(1,1)):
-		super().__init__(model, shader, pos, scale, rotation, material, tiling)
-		self.__points = [
-			-0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5, -0.5,
-			-0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5, 0.5,
-			-0.5, -0.5, -0.5, 0.5, -0.5, -0.5, 0.5, -0.5, 0.5, -0.5, -0.5, 0.5,
-			-0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, 0.5, 0.5, -0.5, 0.5, 0.5,
-			-0.5, -0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5,
-			0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5]
-
-		self.__normals = [
-			0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0,
-			0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0,
-			0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0,
-			0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0,
-			-1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0,
-			1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
-
-		# Doesn't do much now but this helped when working with sprite atlases / sheets
-		self.__frames = {
-			"idle": [
-				1.0, 1.0,
-				1.0, 0.0,
-				0.0, 0.0,
-				0.0, 1.0,
-			]
-		}
+	__points = UNIT_CUBE_POINTS
+
+	__normals = UNIT_CUBE_NORMALS
+
+	__face = [
+		1.0, 1.0,
+		1.0, 0.0,
+		0.0, 0.0,
+		0.0, 1.0,
+	]
 
-		self.frame = "idle"
+	__rest = [0.0] * 40  # uv coordinates for the 5 other faces
 
-		self.__rest = [0.0] * 48
+	# uv rectangle [u offset, v offset, u scale, v scale] of each frame in the bound texture,
+	# replaced by TextureAtlas.rects when frames are packed into an atlas
+	__frames = {"idle": [0.0, 0.0, 1.0, 1.0]}
 
-		self.__steps = 4
+	__steps = 4
+
+	def __init__(self, model: ModelMatrix, shader: Shader3D, pos=None, scale=None, rotation=None, material=None, tiling=(1,1), frames=None, frame="idle"):
+		super().__init__(model, shader, pos, scale, rotation, material, tiling)
+		self.frames = self.__frames if frames is None else frames
+		self.frame = frame
+
+	def uv_rect(self):
+		return self.frames[self.frame]
 
 	def points(self):
 		return self.__points
@@ -105,64 +141,50 @@ class Sprite(GameObject):  # Collection of rectangles ;)
 		return self.__normals
 
 	def uv(self):
-		return self.__frames[self.frame] + self.__rest
+		return self.__face + self.__rest
 
 	def steps(self):
 		return self.__steps
 
 
 class Cube(GameObject):  # Collection of rectangles ;)
-	def __init__(self, model: ModelMatrix, shader: Shader3D, pos=None, scale=None, rotation=None, material=None, tiling=(1,1)):
-		super().__init__(model, shader, pos, scale, rotation, material, tiling)
-		self.__points = [
-			-0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5, -0.5,
-			-0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5, 0.5,
-			-0.5, -0.5, -0.5, 0.5, -0.5, -0.5, 0.5, -0.5, 0.5, -0.5, -0.5, 0.5,
-			-0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, 0.5, 0.5, -0.5, 0.5, 0.5,
-			-0.5, -0.5, -0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5, -0.5,
-			0.5, -0.5, -0.5, 0.5, -0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, -0.5]
-
-		self.__normals = [
-			0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0,
-			0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0,
-			0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0,
-			0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0,
-			-1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0, -1.0, 0.0, 0.0,
-			1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
-
-		self.__uv = [
-			1.0, 1.0,
-			1.0, 0.0,
-			0.0, 0.0,
-			0.0, 1.0,
-
-			1.0, 1.0,
-			1.0, 0.0,
-			0.0, 0.0,
-			0.0, 1.0,
-
-			1.0, 0.0,
-			0.0, 0.0,
-			0.0, 1.0,
-			1.0, 1.0,
-
-			1.0, 0.0,
-			0.0, 0.0,
-			0.0, 1.0,
-			1.0, 1.0,
-
-			1.0, 1.0,
-			0.0, 1.0,
-			0.0, 0.0,
-			1.0, 0.0,
-
-			1.0, 1.0,
-			0.0, 1.0,
-			0.0, 0.0,
-			1.0, 0.0
-		]
-
-		self.__steps = 4
+	__points = UNIT_CUBE_POINTS
+
+	__normals = UNIT_CUBE_NORMALS
+
+	__uv = [
+		1.0, 1.0,
+		1.0, 0.0,
+		0.0, 0.0,
+		0.0, 1.0,
+
+		1.0, 1.0,
+		1.0, 0.0,
+		0.0, 0.0,
+		0.0, 1.0,
+
+		1.0, 0.0,
+		0.0, 0.0,
+		0.0, 1.0,
+		1.0, 1.0,
+
+		1.0, 0.0,
+		0.0, 0.0,
+		0.0, 1.0,
+		1.0, 1.0,
+
+		1.0, 1.0,
+		0.0, 1.0,
+		0.0, 0.0,
+		1.0, 0.0,
+
+		1.0, 1.0,
+		0.0, 1.0,
+		0.0, 0.0,
+		1.0, 0.0
+	]
+
+	__steps = 4
 
 	def points(self):
 		return self.__points
@@ -188,13 +210,10 @@ class Mesh(GameObject):
 				Vec(*m["diffuse"]), Vec(*m["specular"]), Vec(*m["ambient"]), m["shininess"]
 			) for m in self.__file["materials"]
 		}
-		meshes = {  # Assuming type triangles
-			mesh["parts"][0]["id"]: {  # Assuming attributes ["POSITION", "NORMAL", "TEXCOORD0"]
-				"vertices": [v for i in range(0, len(mesh["vertices"]), 8) for v in mesh["vertices"][i:i+3]],
-				"normals":  [v for i in range(3, len(mesh["vertices"]), 8) for v in mesh["vertices"][i:i+3]],
-				"uv":       [v for i in range(6, len(mesh["vertices"]), 8) for v in mesh["vertices"][i:i+2]],
-				"indices": mesh["parts"][0]["indices"]
-			} for mesh in self.__file["meshes"]
+		meshes = {  # Assuming type triangles, uploaded once per file and shared between instances
+			mesh["parts"][0]["id"]: GeometryBuffer.shared(  # Assuming attributes ["POSITION", "NORMAL", "TEXCOORD0"]
+				(filename, mesh["parts"][0]["id"]), lambda mesh=mesh: GeometryBuffer(mesh["vertices"], mesh["parts"][0]["indices"])
+			) for mesh in self.__file["meshes"]
 		}
 		self.__nodes = [{
 			"coord": Coord(
@@ -207,31 +226,194 @@ class Mesh(GameObject):
 			"mesh": meshes[node["parts"][0]["meshpartid"]]
 		} for node in self.__file["nodes"]]
 
-	# Passes object positions and normals to shader
-	def set(self):
-		pass
+	def cull(self, frustum: Frustum) -> bool:  # Extent of the model isn't known so it's never culled
+		return True
 
-	def draw_set(self):
-		self.draw()
+	def pick_lights(self) -> np.ndarray:  # Extent of the model isn't known so every light is used
+		return self.coord.shader.pick_lights(max_lights=self.max_lights)
 
-	def __set(self, node):
-		self.coord.shader.set_position_attribute(node["mesh"]["vertices"])
-		self.coord.shader.set_normal_attribute(node["mesh"]["normals"])
-		uv = np.array(node["mesh"]["uv"])
-		uv[::2] *= self.tiling[0]
-		uv[1::2] *= self.tiling[1]
-		self.coord.shader.set_uv_attribute(uv)
+	def set(self, lights: np.ndarray = None):
+		self.coord.shader.use_lights(self.pick_lights() if lights is None else lights)
 
 	# Draws object from its points and with its color
 	def raw_draw(self):
+		self.coord.shader.set_uv_scale(self.tiling)
+		self.coord.shader.set_uv_rect(self.uv_rect())
 		for node in self.__nodes:
 			node["coord"].apply()
 			self.coord.shader.set_material(*node["material"])
-			self.__set(node)
-			glDrawElements(GL_TRIANGLES, len(node["mesh"]["indices"]), GL_UNSIGNED_SHORT, node["mesh"]["indices"])
+			node["mesh"].bind()
+			node["mesh"].draw()
 			node["coord"].unapply()
 
 
+# Merges static objects sharing a texture and material into one mesh, drawn with a single call.
+# Given static lights, faces are split into cells of step size and the lights baked into their vertices.
+# Baked meshes are cached in CACHE_DIR, keyed by everything they're built from, rebake ignores the cache.
+# Each object keeps its own range of indices and bounding box, so objects out of view can be culled.
+class StaticBatch(GameObject):
+	CACHE_DIR = "cache"
+	BAKE_VERSION = 2  # Part of cache key, bump when baking changes
+
+	def __init__(self, model: ModelMatrix, shader: Shader3D, objects: list[GameObject], material=None, lights=None, step=0.5, rebake=False):
+		super().__init__(model, shader, material=objects[0].material if material is None else material)
+		self.baked = lights is not None
+		if self.baked:
+			vertices, indices, self.__ranges, self.__boxes = self.load_baked(objects, lights, step, rebake)
+		else:
+			vertices, indices, self.__ranges, self.__boxes = self.bake(objects)
+		self.__geometry = GeometryBuffer(vertices, indices, self.baked)
+		self.__bounds = vertices[:, :3].min(axis=0), vertices[:, :3].max(axis=0)
+		self.__visible: np.ndarray | None = None  # Objects in view at last cull, all of them before culling
+		self.__groups: list[tuple[np.ndarray, np.ndarray]] = []  # (lights, objects) of the draw, see pick_lights
+
+	# Pre-transforms vertices and tiles uv coordinates.
+	# Also returns [first index, index count] and [lo, hi] bounding box of each object.
+	@staticmethod
+	def bake(objects: list[GameObject], step: float = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+		vertices, indices, offset = [], [], 0
+		ranges, boxes, first = [], [], 0
+		for ob in objects:
+			assert not ob.coord.rotation and ob.coord.orientation is None, "Only position and scale can be baked into a static batch"
+			scale = np.array([*ob.coord.scalar], np.float32)
+			points = np.reshape(np.asarray(ob.points(), np.float32), (-1, 3)) * scale + [*ob.coord.pos]
+			normals = np.reshape(np.asarray(ob.normals(), np.float32), (-1, 3)) / scale  # Inverse transpose of scale
+			normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+			uv = np.reshape(np.asarray(ob.uv(), np.float32), (-1, 2)) * ob.tiling
+			if step is None:
+				vertices.append(np.hstack((points, normals, uv)))
+				indices.append(GeometryBuffer.fan_indices(len(points), ob.steps()) + offset)
+			else:
+				assert ob.steps() == 4, "Only quads can be split into cells"
+				cells, cell_indices = GeometryBuffer.tessellate(points, normals, uv, step)
+				vertices.append(cells)
+				indices.append(cell_indices + offset)
+			offset += len(vertices[-1])
+			ranges.append((first, len(indices[-1])))
+			first += len(indices[-1])
+			extent = np.abs(scale) / 2
+			boxes.append((np.array([*ob.coord.pos]) - extent, np.array([*ob.coord.pos]) + extent))
+		return np.vstack(vertices), np.concatenate(indices), np.array(ranges, np.int64), np.array(boxes, np.float32)
+
+	@classmethod
+	def load_baked(cls, objects: list[GameObject], lights, step: float, rebake: bool = False) -> tuple[np.ndarray, ...]:
+		key = hashlib.sha1(repr([
+			cls.BAKE_VERSION, step, [[*light] for light in lights],
+			[(ob.points(), ob.normals(), ob.uv(), ob.steps(), ob.tiling, ob.coord.pos, ob.coord.scalar) for ob in objects]
+		]).encode()).hexdigest()
+		path = os.path.join(cls.CACHE_DIR, f"bake_{key}.npz")
+		if not rebake and os.path.exists(path):
+			with np.load(path) as cached:
+				return cached["vertices"], cached["indices"], cached["ranges"], cached["boxes"]
+
+		vertices, indices, ranges, boxes = cls.bake(objects, step)
+		vertices = np.hstack((vertices, bake_lights(vertices[:, :3], vertices[:, 3:6], lights)))
+		os.makedirs(cls.CACHE_DIR, exist_ok=True)
+		np.savez(path, vertices=vertices, indices=indices, ranges=ranges, boxes=boxes)
+		return vertices, indices, ranges, boxes
+
+	def geometry(self) -> GeometryBuffer:
+		return self.__geometry
+
+	def bounds(self) -> tuple[np.ndarray, np.ndarray]:
+		return self.__bounds
+
+	def cull(self, frustum: Frustum) -> bool:  # Keeps objects in view for the next draw
+		self.__visible = np.flatnonzero(frustum.visible_batch(self.__boxes[:, 0], self.__boxes[:, 1]))
+		return len(self.__visible) > 0
+
+	# Lights are picked for each object in view by its own box, objects picking the same lights are drawn together.
+	# Returns the lights of the group needing the largest shader variant, the rest are used as their group is drawn.
+	def pick_lights(self) -> np.ndarray:
+		visible = np.arange(len(self.__ranges)) if self.__visible is None else self.__visible
+		shader = self.coord.shader
+		if shader.lights is None or not len(visible):
+			self.__groups = [(shader.pick_lights(max_lights=self.max_lights, baked=self.baked), visible)]
+			return self.__groups[0][0]
+		count = shader.max_lights if self.max_lights is None else min(self.max_lights, shader.max_lights)
+		picks = shader.lights.select_batch(self.__boxes[visible, 0], self.__boxes[visible, 1], count, dynamic=self.baked)
+		picks, groups = np.unique(picks, axis=0, return_inverse=True)
+		self.__groups = [(shader.pad_lights(pick[pick >= 0]), visible[groups.reshape(-1) == ind]) for ind, pick in enumerate(picks)]
+		self.__groups.sort(key=lambda group: -len(group[0]))
+		return self.__groups[0][0]
+
+	def raw_draw(self):
+		self.coord.shader.set_material(*self.material)
+		if self.__visible is None and not self.__groups:
+			self.geometry().draw()
+			return
+		for ind, (lights, objects) in enumerate(self.__groups):
+			if ind:  # First group's lights were set with the batch
+				self.coord.shader.use_lights(lights, self.baked)
+			ranges = self.__ranges[objects]
+			self.geometry().draw_ranges(ranges[:, 0], ranges[:, 1])
+
+
+# Draws every sprite of a kind facing the camera with a single instanced call
+class SpriteBatch(GameObject):
+	def __init__(self, model: ModelMatrix, shader: Shader3D, frames: dict[str, list[float]] = None, material=None):
+		super().__init__(model, shader, material=material)
+		# uv rectangle [u offset, v offset, u scale, v scale] of each frame in the bound texture, at most Shader3D.MAX_FRAMES
+		self.frames = {"idle": [0.0, 0.0, 1.0, 1.0]} if frames is None else frames
+		self.__frame_index = {frame: ind for ind, frame in enumerate(self.frames)}
+		self.__sprite = Sprite(model, shader)  # Only used for its shared geometry
+		self.__instances: InstanceBuffer | None = None
+		self.__bounds = np.zeros(3, np.float32), np.zeros(3, np.float32)
+
+	def geometry(self) -> GeometryBuffer:
+		return self.__sprite.geometry()
+
+	def instances(self) -> InstanceBuffer:
+		if self.__instances is None:
+			self.__instances = InstanceBuffer(self.geometry())
+		return self.__instances
+
+	def frame_indices(self, names) -> np.ndarray:  # Indices of frames by name, as taken by submit
+		return np.array([self.__frame_index[name] for name in names], np.float32)
+
+	# Uploads position, scale and frame of sprites, all of which will face eye. Sprites outside frustum are left out.
+	# extra are (positions, scales, frame indices) arrays of more sprites, e.g. from EnemySwarm.instances
+	# Each sprite picks its own lights, those reaching it most strongly, at most max_lights and Shader3D.INSTANCE_LIGHTS.
+	def submit(self, sprites: list[Sprite], eye: Vec, frustum: Frustum = None, extra: tuple = None):
+		positions = np.array([[*sprite.coord.pos] for sprite in sprites], np.float32).reshape(-1, 3)
+		scales = np.array([[*sprite.coord.scalar] for sprite in sprites], np.float32).reshape(-1, 3)
+		frames = self.frame_indices(sprite.frame for sprite in sprites)
+		if extra is not None:
+			extra_positions, extra_scales, extra_frames = extra
+			positions = np.concatenate((positions, np.asarray(extra_positions, np.float32)))
+			scales = np.concatenate((scales, np.asarray(extra_scales, np.float32)))
+			frames = np.concatenate((frames, np.asarray(extra_frames, np.float32)))
+		extent = 0.5 * np.linalg.norm(scales, axis=1, keepdims=True)  # Sprites turn to face eye, so as wide as they are in every direction
+		if frustum is not None:
+			visible = frustum.visible_batch(positions - extent, positions + extent)
+			positions, scales, frames, extent = positions[visible], scales[visible], frames[visible], extent[visible]
+		lights = self.coord.shader.pick_instance_lights(positions - extent, positions + extent, self.max_lights)
+		self.instances().upload(billboard_batch(positions, scales, eye), frames, lights)
+		if len(positions):
+			self.__bounds = (positions - extent).min(axis=0), (positions + extent).max(axis=0)
+
+	def bounds(self) -> tuple[np.ndarray, np.ndarray]:
+		return self.__bounds
+
+	def cull(self, frustum: Frustum) -> bool:  # Sprites were culled when submitted
+		return self.instances().count > 0
+
+	def pick_lights(self) -> np.ndarray:  # Lights were picked per sprite when submitted
+		return self.coord.shader.instanced_lights()
+
+	def set(self, lights: np.ndarray = None):
+		self.coord.shader.use_lights(self.pick_lights() if lights is None else lights)
+		self.instances().bind()
+		self.coord.shader.set_uv_scale(self.tiling)
+		self.coord.shader.set_frame_rects([*self.frames.values()])
+
+	def raw_draw(self):
+		self.coord.shader.set_material(*self.material)
+		self.coord.shader.set_instanced(True)
+		self.instances().draw()
+		self.coord.shader.set_instanced(False)
+
+
 class ShapeTree:  # Object hierarchy
 	def __init__(self, model: ModelMatrix, shader: Shader3D, pos=None, rot=None, children=None):
 		self.coord = Coord(model, shader, pos, rotation=rot)
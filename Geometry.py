@@ -0,0 +1,164 @@
+from OpenGL.GL import *
+
+from Shader import Shader3D
+
+import numpy as np
+
+import ctypes
+
+from math import ceil
+
+
+# Vertex and index data uploaded once to GPU buffers and drawn through a vertex array object
+class GeometryBuffer:
+	__shared: dict = {}  # Buffers shared between every object with the same geometry
+
+	# vertices are interleaved [x, y, z, nx, ny, nz, u, v, ...], followed by [r, g, b] of baked light if baked
+	def __init__(self, vertices, indices, baked: bool = False):
+		vertices = np.ascontiguousarray(vertices, np.float32)
+		self.baked = baked
+		self.stride = 11 if baked else 8
+		self.vertex_count = vertices.size // self.stride
+		if self.vertex_count > 0xFFFF:
+			indices, self.index_type = np.ascontiguousarray(indices, np.uint32), GL_UNSIGNED_INT
+		else:
+			indices, self.index_type = np.ascontiguousarray(indices, np.uint16), GL_UNSIGNED_SHORT
+		self.count = len(indices)
+		self.index_size = indices.itemsize
+
+		self.vao = glGenVertexArrays(1)
+		glBindVertexArray(self.vao)
+
+		self.vbo, self.ebo = glGenBuffers(2)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+		glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+		self.attach()
+
+		glBindVertexArray(0)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+	def attach(self):  # Points the bound vertex array object at this buffer's vertices and indices
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		attributes = [(Shader3D.POSITION_LOC, 3, 0), (Shader3D.NORMAL_LOC, 3, 12), (Shader3D.UV_LOC, 2, 24)]
+		if self.baked:
+			attributes.append((Shader3D.BAKED_LOC, 3, 32))
+		for loc, size, offset in attributes:
+			glEnableVertexAttribArray(loc)
+			glVertexAttribPointer(loc, size, GL_FLOAT, False, self.stride * 4, ctypes.c_void_p(offset))
+		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)  # Element buffer binding is stored in the vertex array object
+
+	@staticmethod
+	def interleave(points, normals, uv) -> np.ndarray:  # Packs separate attribute lists into one vertex array
+		return np.hstack((
+			np.reshape(np.asarray(points, np.float32), (-1, 3)),
+			np.reshape(np.asarray(normals, np.float32), (-1, 3)),
+			np.reshape(np.asarray(uv, np.float32), (-1, 2)),
+		))
+
+	@staticmethod
+	def fan_indices(vertex_count: int, steps: int) -> np.ndarray:  # Triangulates faces drawn as triangle fans of steps points
+		face = np.array([(0, x, x + 1) for x in range(1, steps - 1)], np.uint32).ravel()
+		return (np.arange(0, vertex_count, steps, dtype=np.uint32)[:, None] + face).ravel()
+
+	@staticmethod
+	def tessellate(points, normals, uv, step: float) -> tuple[np.ndarray, np.ndarray]:  # Splits quads into cells no larger than step
+		points = np.reshape(np.asarray(points, np.float32), (-1, 4, 3))
+		normals = np.reshape(np.asarray(normals, np.float32), (-1, 4, 3))
+		uv = np.reshape(np.asarray(uv, np.float32), (-1, 4, 2))
+		vertices, indices, offset = [], [], 0
+		for quad in range(len(points)):
+			c0, c1, c2, c3 = np.hstack((points[quad], normals[quad], uv[quad]))  # Corners in triangle fan order
+			rows = max(1, ceil(np.linalg.norm(c1[:3] - c0[:3]) / step))
+			cols = max(1, ceil(np.linalg.norm(c3[:3] - c0[:3]) / step))
+			t = np.linspace(0, 1, rows + 1, dtype=np.float32)[:, None, None]
+			s = np.linspace(0, 1, cols + 1, dtype=np.float32)[None, :, None]
+			grid = (1 - s) * (1 - t) * c0 + (1 - s) * t * c1 + s * t * c2 + s * (1 - t) * c3
+			ind = np.arange((rows + 1) * (cols + 1), dtype=np.uint32).reshape(rows + 1, cols + 1)
+			a, b, c, d = ind[:-1, :-1], ind[1:, :-1], ind[1:, 1:], ind[:-1, 1:]
+			indices.append(np.stack((a, b, c, a, c, d), axis=-1).ravel() + offset)  # Same winding as the fan
+			vertices.append(grid.reshape(-1, 8))
+			offset += grid.shape[0] * grid.shape[1]
+		return np.vstack(vertices), np.concatenate(indices)
+
+	@classmethod
+	def from_faces(cls, points, normals, uv, steps: int):  # Builds buffer from the points / normals / uv / steps of a GameObject
+		vertices = cls.interleave(points, normals, uv)
+		return cls(vertices, cls.fan_indices(len(vertices), steps))
+
+	@classmethod
+	def shared(cls, key, build):  # Returns buffer stored under key, build is only called the first time
+		if (buffer := cls.__shared.get(key)) is None:
+			buffer = cls.__shared[key] = build()
+		return buffer
+
+	def bind(self):
+		glBindVertexArray(self.vao)
+
+	def draw(self):  # Draws with whatever vertex array is bound, like glDrawArrays used to
+		glDrawElements(GL_TRIANGLES, self.count, self.index_type, None)
+
+	def draw_ranges(self, firsts: np.ndarray, counts: np.ndarray):  # Draws parts of the index buffer in one call
+		if len(counts):
+			offsets = (ctypes.c_void_p * len(counts))(*(int(first) * self.index_size for first in firsts))
+			glMultiDrawElements(GL_TRIANGLES, np.ascontiguousarray(counts, np.int32), self.index_type, offsets, len(counts))
+
+
+# Per-instance model matrices and frame indices, drawn over a shared GeometryBuffer with one instanced call
+class InstanceBuffer:
+	STRIDE = 25  # Column-major model matrix followed by frame index and 8 light indices
+
+	def __init__(self, geometry: GeometryBuffer, capacity: int = 64):
+		self.geometry = geometry
+		self.capacity = 0
+		self.count = 0
+		self.data: np.ndarray = None
+
+		self.vao = glGenVertexArrays(1)
+		glBindVertexArray(self.vao)
+		geometry.attach()
+
+		self.vbo = glGenBuffers(1)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		for col in range(4):  # mat4 attributes take up one location per column
+			glEnableVertexAttribArray(Shader3D.INSTANCE_MATRIX_LOC + col)
+			glVertexAttribPointer(Shader3D.INSTANCE_MATRIX_LOC + col, 4, GL_FLOAT, False, self.STRIDE * 4, ctypes.c_void_p(col * 16))
+			glVertexAttribDivisor(Shader3D.INSTANCE_MATRIX_LOC + col, 1)
+		glEnableVertexAttribArray(Shader3D.INSTANCE_FRAME_LOC)
+		glVertexAttribPointer(Shader3D.INSTANCE_FRAME_LOC, 1, GL_FLOAT, False, self.STRIDE * 4, ctypes.c_void_p(64))
+		glVertexAttribDivisor(Shader3D.INSTANCE_FRAME_LOC, 1)
+		for col in range(2):
+			glEnableVertexAttribArray(Shader3D.INSTANCE_LIGHTS_LOC + col)
+			glVertexAttribPointer(Shader3D.INSTANCE_LIGHTS_LOC + col, 4, GL_FLOAT, False, self.STRIDE * 4, ctypes.c_void_p(68 + col * 16))
+			glVertexAttribDivisor(Shader3D.INSTANCE_LIGHTS_LOC + col, 1)
+		self.reserve(capacity)
+
+		glBindVertexArray(0)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+	def reserve(self, capacity: int):  # Reallocates instance storage if it can't hold capacity instances
+		if capacity <= self.capacity:
+			return
+		self.capacity = max(capacity, 2 * self.capacity)
+		self.data = np.zeros((self.capacity, self.STRIDE), np.float32)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		glBufferData(GL_ARRAY_BUFFER, self.data.nbytes, None, GL_STREAM_DRAW)
+
+	# matrices are a (N, 4, 4) row-major stack, lights (N, 8) indices from Shader3D.pick_instance_lights
+	def upload(self, matrices: np.ndarray, frames=0, lights=-1):
+		self.count = len(matrices)
+		self.reserve(self.count)
+		self.data[:self.count, :16] = np.reshape(np.transpose(matrices, (0, 2, 1)), (-1, 16))
+		self.data[:self.count, 16] = frames
+		self.data[:self.count, 17:25] = lights
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		glBufferData(GL_ARRAY_BUFFER, self.data.nbytes, None, GL_STREAM_DRAW)  # Orphan storage still in use by last draw
+		glBufferSubData(GL_ARRAY_BUFFER, 0, self.count * self.STRIDE * 4, self.data)
+
+	def bind(self):
+		glBindVertexArray(self.vao)
+
+	def draw(self):
+		if self.count:
+			glDrawElementsInstanced(GL_TRIANGLES, self.geometry.count, self.geometry.index_type, None, self.count)
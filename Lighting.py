@@ -1,4 +1,22 @@
+from OpenGL.GL import *
+
 from Vec import Vec
+from Shader import Shader3D
+
+import numpy as np
+
+
+# Diffuse light each point receives from lights, as computed in simple3D.frag.
+# Specular depends on where it's seen from so it isn't baked, static lights shouldn't have any.
+def bake_lights(points: np.ndarray, normals: np.ndarray, lights) -> np.ndarray:
+	colors = np.zeros((len(points), 3), np.float32)
+	normal_lengths = np.linalg.norm(normals, axis=1)
+	for light in lights:
+		s = np.array([*light.pos], np.float32) - points
+		dist = np.linalg.norm(s, axis=1)
+		lambert = np.maximum(0, np.einsum("ij,ij->i", normals, s) / (normal_lengths * dist)) * np.maximum(1, 2 / dist)
+		colors += lambert[:, None] * np.array([*light.diff], np.float32)
+	return colors
 
 
 class LightingElement:  # Common properties for Lights and Materials
@@ -35,3 +53,75 @@ class Material(LightingElement):  # Material properties of object
 		yield self.spec
 		yield self.amb
 		yield self.shine
+
+
+# Lights packed into one std140 uniform buffer shared by every shader, only changed lights are uploaded.
+# The buffer starts with the summed ambience of all lights, followed by each light.
+class LightManager:
+	FLOATS = 16  # diffuse, specular, ambience and position, each padded to a vec4
+
+	def __init__(self, capacity: int = 8):
+		self.capacity = capacity
+		self.data = np.zeros(4 + capacity * self.FLOATS, np.float32)
+		self.ambience = self.data[:4]  # Views into data
+		self.lights = self.data[4:].reshape(capacity, self.FLOATS)
+		self.static = np.zeros(capacity, bool)  # Lights baked into static geometry
+		self.__dirty = [self.data.size, 0]  # Range of floats changed since last flush, empty when start >= end
+		self.uploads = 0  # Number of buffer updates issued
+
+		self.ubo = glGenBuffers(1)
+		glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+		glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, self.data, GL_DYNAMIC_DRAW)
+		glBindBufferBase(GL_UNIFORM_BUFFER, Shader3D.LIGHTS_BINDING, self.ubo)
+		glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+	def __mark(self, start: int, end: int):
+		self.__dirty = [min(self.__dirty[0], start), max(self.__dirty[1], end)]
+
+	# Packs light into slot ind, marked dirty only if it changed. static lights must be baked, see bake_lights
+	def set_light(self, light: Light, ind: int = 0, static: bool = False):
+		self.static[ind] = static
+		packed = np.array([*light.diff, 1.0, *light.spec, 1.0, *light.amb, 1.0, *light.pos, 1.0], np.float32)
+		if np.array_equal(packed, self.lights[ind]):
+			return
+		self.lights[ind] = packed
+		self.__mark(4 + ind * self.FLOATS, 4 + (ind + 1) * self.FLOATS)
+		ambience = self.lights[:, 8:12].sum(axis=0)
+		if not np.array_equal(ambience, self.ambience):
+			self.ambience[:] = ambience
+			self.__mark(0, 4)
+
+	# Indices of the count strongest lights at the box lo - hi, by diffuse and specular over squared distance.
+	# Lights without diffuse or specular are left out, ambience is always applied through the summed ambience.
+	# dynamic leaves out static lights as well, for geometry they're baked into.
+	def select(self, lo=None, hi=None, count: int = None, dynamic: bool = False) -> list[int]:
+		strength = self.lights[:, 0:3].sum(axis=1) + self.lights[:, 4:7].sum(axis=1)
+		if dynamic:
+			strength[self.static] = 0
+		if lo is not None:
+			positions = self.lights[:, 12:15]
+			dist = np.linalg.norm(np.maximum(np.maximum(np.asarray(lo) - positions, positions - np.asarray(hi)), 0), axis=1)
+			strength = strength / (1 + dist * dist)
+		order = [int(ind) for ind in np.argsort(-strength, kind="stable") if strength[ind] > 0]
+		return order[:count]
+
+	# Same as select for each of N boxes lo - hi at once, (N, count) indices padded with -1 where fewer lights reach
+	def select_batch(self, lo: np.ndarray, hi: np.ndarray, count: int, dynamic: bool = False) -> np.ndarray:
+		strength = self.lights[:, 0:3].sum(axis=1) + self.lights[:, 4:7].sum(axis=1)
+		if dynamic:
+			strength = np.where(self.static, 0, strength)
+		positions = self.lights[:, 12:15]
+		gaps = np.maximum(np.maximum(lo[:, None] - positions, positions - hi[:, None]), 0)
+		strength = strength / (1 + (gaps * gaps).sum(axis=2))  # (N, lights)
+		order = np.argsort(-strength, axis=1, kind="stable")[:, :count]
+		return np.where(np.take_along_axis(strength, order, axis=1) > 0, order, -1)
+
+	def flush(self):  # Uploads the dirty range, call before drawing
+		start, end = self.__dirty
+		if start >= end:
+			return
+		glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+		glBufferSubData(GL_UNIFORM_BUFFER, start * 4, (end - start) * 4, self.data[start:end])
+		glBindBuffer(GL_UNIFORM_BUFFER, 0)
+		self.__dirty = [self.data.size, 0]
+		self.uploads += 1
@@ -7,30 +7,95 @@ from math import sin, cos, tan
 from game_resources import look
 
 
-class Matrix:
-	def get_matrix(self) -> list[float]: pass  # Defined by subclass
+IDENTITY = np.identity(4, np.float32)
+
+
+class Matrix:  # get_matrix gives a row-major, contiguous float32 4x4 array which can be uploaded as is
+	def get_matrix(self) -> np.ndarray: pass  # Defined by subclass
+
+
+class MatrixStackError(Exception): pass
 
 
 class ModelMatrix(Matrix):
-	def __init__(self):
-		self.matrix: np.ndarray = None
+	def __init__(self, depth: int = 32):
+		# Fixed depth stack in one preallocated array, pushing and popping only moves the top index
+		self.__stack = np.empty((depth, 4, 4), np.float32)
+		self.__levels = [*self.__stack]  # Views of each level, made once so drawing doesn't allocate them
+		self.__top = 0
+		self.__product = np.empty((4, 4), np.float32)  # Scratch space for multiply
 		self.load_identity()
-		self.stack: list[np.ndarray] = []
+
+	@property
+	def matrix(self) -> np.ndarray:  # Current matrix, top of the stack
+		return self.__levels[self.__top]
+
+	@matrix.setter
+	def matrix(self, matrix: np.ndarray):
+		np.copyto(self.__levels[self.__top], matrix)
+
+	@property
+	def depth(self) -> int:  # How many matrices are pushed
+		return self.__top
 
 	def load_identity(self):
-		self.matrix = np.identity(4, np.float64)
+		np.copyto(self.__levels[self.__top], IDENTITY)
 
-	def get_matrix(self) -> list[float]:
-		return self.matrix.tolist()
+	def get_matrix(self) -> np.ndarray:
+		return self.matrix
 
 	def push_matrix(self):
-		self.stack.append(self.matrix.copy())
+		if self.__top + 1 == len(self.__levels):
+			raise MatrixStackError(f"Matrix stack overflow, deeper than {len(self.__levels)} levels")
+		np.copyto(self.__levels[self.__top + 1], self.__levels[self.__top])
+		self.__top += 1
 
 	def pop_matrix(self):
-		self.matrix = self.stack.pop()
+		if self.__top == 0:
+			raise MatrixStackError("Matrix stack underflow, popped more than was pushed")
+		self.__top -= 1
+
+	@staticmethod
+	def compose(pos: Vec, rotation: Vec, scale: Vec, orientation: list[int | float] = None, out: np.ndarray = None) -> np.ndarray:
+		"""
+			Closed form of translate(pos) * transform(orientation) * rotate(rotation) * scale(scale),
+			written straight into out (a new float32 4x4 matrix if none is given) without intermediate matrices
+		"""
+		sx, cx = sin(rotation.x), cos(rotation.x)
+		sy, cy = sin(rotation.y), cos(rotation.y)
+		sz, cz = sin(rotation.z), cos(rotation.z)
+
+		# rotate_x * rotate_y * rotate_z
+		r00, r01, r02 = cy * cz, -cy * sz, sy
+		r10, r11, r12 = cx * sz + sx * sy * cz, cx * cz - sx * sy * sz, -sx * cy
+		r20, r21, r22 = sx * sz - cx * sy * cz, sx * cz + cx * sy * sz, cx * cy
+		tx, ty, tz = pos.x, pos.y, pos.z
+
+		if orientation is not None:  # Row-major 4x4 with bottom row 0, 0, 0, 1
+			o = orientation
+			r00, r01, r02, r10, r11, r12, r20, r21, r22 = (
+				o[0] * r00 + o[1] * r10 + o[2] * r20, o[0] * r01 + o[1] * r11 + o[2] * r21, o[0] * r02 + o[1] * r12 + o[2] * r22,
+				o[4] * r00 + o[5] * r10 + o[6] * r20, o[4] * r01 + o[5] * r11 + o[6] * r21, o[4] * r02 + o[5] * r12 + o[6] * r22,
+				o[8] * r00 + o[9] * r10 + o[10] * r20, o[8] * r01 + o[9] * r11 + o[10] * r21, o[8] * r02 + o[9] * r12 + o[10] * r22,
+			)
+			tx, ty, tz = tx + o[3], ty + o[7], tz + o[11]
+
+		if out is None:
+			out = np.empty((4, 4), np.float32)
+		out[:] = (
+			(r00 * scale.x, r01 * scale.y, r02 * scale.z, tx),
+			(r10 * scale.x, r11 * scale.y, r12 * scale.z, ty),
+			(r20 * scale.x, r21 * scale.y, r22 * scale.z, tz),
+			(0.0, 0.0, 0.0, 1.0)
+		)
+		return out
+
+	def multiply(self, matrix: np.ndarray):  # In place, current = current * matrix
+		np.matmul(self.__levels[self.__top], matrix, out=self.__product)
+		np.copyto(self.__levels[self.__top], self.__product)
 
 	def transform(self, trans: list[int | float]):
-		self.matrix = self.matrix.dot(np.ndarray((4, 4), np.float64, np.array([*map(np.float64, trans)])))
+		self.multiply(np.reshape(np.asarray(trans, np.float32), (4, 4)))
 
 	def translate(self, off: Vec):
 		self.transform([
@@ -78,12 +143,67 @@ class ModelMatrix(Matrix):
 		])
 
 
+def compose_batch(positions, rotations, scales, orientations=None, out: np.ndarray = None) -> np.ndarray:
+	"""
+		ModelMatrix.compose for N objects at once, returns a (N, 4, 4) float32 stack.
+		positions, rotations (euler x, y, z) and scales are (N, 3), rotations can be None for no rotation,
+		orientations are an optional (N, 3, 3) or (N, 4, 4) row-major stack
+	"""
+	positions = np.asarray(positions, np.float32).reshape(-1, 3)
+	scales = np.asarray(scales, np.float32).reshape(-1, 3)
+	count = len(positions)
+	out = np.empty((count, 4, 4), np.float32) if out is None else out[:count]
+
+	if rotations is None:
+		rot = np.broadcast_to(np.identity(3, np.float32), (count, 3, 3))
+	else:  # rotate_x * rotate_y * rotate_z
+		rotations = np.asarray(rotations, np.float32).reshape(-1, 3)
+		(sx, sy, sz), (cx, cy, cz) = np.sin(rotations).T, np.cos(rotations).T
+		rot = np.empty((count, 3, 3), np.float32)
+		rot[:, 0, 0], rot[:, 0, 1], rot[:, 0, 2] = cy * cz, -cy * sz, sy
+		rot[:, 1, 0], rot[:, 1, 1], rot[:, 1, 2] = cx * sz + sx * sy * cz, cx * cz - sx * sy * sz, -sx * cy
+		rot[:, 2, 0], rot[:, 2, 1], rot[:, 2, 2] = sx * sz - cx * sy * cz, sx * cz + cx * sy * sz, cx * cy
+
+	if orientations is not None:
+		orientations = np.asarray(orientations, np.float32)
+		rot = np.matmul(orientations[:, :3, :3], rot)
+		if orientations.shape[-1] == 4:
+			positions = positions + orientations[:, :3, 3]
+
+	np.multiply(rot, scales[:, None, :], out=out[:, :3, :3])  # Scales columns
+	out[:, :3, 3] = positions
+	out[:, 3, :3] = 0
+	out[:, 3, 3] = 1
+	return out
+
+
+def look_batch(positions: np.ndarray, target, up=(0, 1, 0)) -> np.ndarray:
+	"""
+		(N, 3, 3) orientations of objects at positions looking at target,
+		same as the orientation Coord.look gives each of them
+	"""
+	c = positions - np.asarray([*target], np.float32)
+	c /= np.maximum(np.linalg.norm(c, axis=1, keepdims=True), 1e-12)
+	a = np.cross(np.asarray([*up], np.float32), c)
+	a /= np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+	return np.stack((a, np.cross(c, a), c), axis=2)  # a, b, c are columns
+
+
+def billboard_batch(positions: np.ndarray, scales: np.ndarray, eye, up=(0, 1, 0)) -> np.ndarray:
+	"""
+		(N, 4, 4) model matrices for objects at positions, scaled and facing eye,
+		same as calling Coord.look(eye) and Coord.apply() for each object
+	"""
+	return compose_batch(positions, None, scales, look_batch(positions, eye, up))
+
+
 class ViewMatrix(Matrix):
 	def __init__(self):
 		self.eye = Vec()
 		self.u = Vec.left()
 		self.v = Vec.up()
 		self.n = Vec.forth()
+		self.__matrix = np.identity(4, np.float32)  # Refilled by get_matrix
 
 	def look(self, eye: Vec, center: Vec, up: Vec):
 		self.eye = eye
@@ -106,12 +226,14 @@ class ViewMatrix(Matrix):
 	def roll(self, a: int | float):
 		self.u, self.v = self.u * (ca:=cos(a)) + self.v * (sa:=sin(a)),  self.u * -sa + self.v * ca
 
-	def get_matrix(self) -> list[float]:
+	def get_matrix(self) -> np.ndarray:
 		neg_eye = -self.eye
-		return [*self.u, neg_eye.dot(self.u),
-				*self.v, neg_eye.dot(self.v),
-				*self.n, neg_eye.dot(self.n),
-				0, 0, 0, 1]
+		self.__matrix[:3] = (
+			(*self.u, neg_eye.dot(self.u)),
+			(*self.v, neg_eye.dot(self.v)),
+			(*self.n, neg_eye.dot(self.n)),
+		)
+		return self.__matrix
 
 
 class ProjectionMatrix(Matrix):
@@ -123,6 +245,7 @@ class ProjectionMatrix(Matrix):
 		self.near = -1
 		self.far = 100
 		self.is_ortho = True
+		self.__matrix = np.zeros((4, 4), np.float32)  # Refilled by get_matrix
 
 	def set_orthographic(self, left, right, bottom, top, near, far):
 		self.left = left
@@ -142,7 +265,7 @@ class ProjectionMatrix(Matrix):
 		self.left = -self.right
 		self.is_ortho = False
 
-	def get_matrix(self) -> list[float]:
+	def get_matrix(self) -> np.ndarray:
 		if self.is_ortho:
 			A = 2 / (self.right - self.left)
 			B = -(self.right + self.left) / (self.right - self.left)
@@ -151,10 +274,12 @@ class ProjectionMatrix(Matrix):
 			E = 2 / (self.near - self.far)
 			F = (self.near + self.far) / (self.near - self.far)
 
-			return [A,0,0,B,
-					0,C,0,D,
-					0,0,E,F,
-					0,0,0,1]
+			self.__matrix[:] = (
+				(A,0,0,B),
+				(0,C,0,D),
+				(0,0,E,F),
+				(0,0,0,1)
+			)
 		else:
 			n2 = 2 * self.near
 			A = n2 / (self.right - self.left)
@@ -164,9 +289,10 @@ class ProjectionMatrix(Matrix):
 			E = -(self.far + self.near) / (self.far - self.near)
 			F = -(n2 * self.far) / (self.far - self.near)
 
-			return [
-				A, 0, B, 0,
-				0, C, D, 0,
-				0, 0, E, F,
-				0, 0,-1, 0
-			]
\ No newline at end of file
+			self.__matrix[:] = (
+				(A, 0, B, 0),
+				(0, C, D, 0),
+				(0, 0, E, F),
+				(0, 0,-1, 0)
+			)
+		return self.__matrix
\ No newline at end of file
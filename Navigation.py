@@ -0,0 +1,161 @@
+from Vec import Vec
+
+import numpy as np
+
+from math import ceil
+
+
+# Distance field over a grid of floor plan cells towards a target, shared by every imp chasing it.
+# Cells whose centre is within clearance of a wall are blocked, the rest are walkable in 8 directions, diagonals only
+# when both cells beside them are walkable so nothing cuts corners. Distances are steps from the target's cell,
+# found breadth first. Each cell points towards its neighbours closest to the target, see sample.
+class FlowField:
+	# Neighbour offsets in cells, orthogonal ones first
+	OFFSETS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+
+	def __init__(self, walls: list, cell_size: float = 0.5, clearance: float = 0.2):
+		boxes = np.array([  # [x min, z min, x max, z max]
+			[wall.coord.pos.x - abs(wall.coord.scalar.x) / 2, wall.coord.pos.z - abs(wall.coord.scalar.z) / 2,
+			 wall.coord.pos.x + abs(wall.coord.scalar.x) / 2, wall.coord.pos.z + abs(wall.coord.scalar.z) / 2]
+			for wall in walls
+		], np.float64)
+		self.boxes = boxes
+		self.cell_size = cell_size
+		self.origin = boxes[:, :2].min(axis=0)
+		self.shape = tuple(max(1, ceil(size / cell_size)) for size in boxes[:, 2:].max(axis=0) - self.origin)
+		self.cells = self.shape[0] * self.shape[1]
+
+		self.blocked = np.zeros(self.shape, bool)
+		for x0, z0, x1, z1 in boxes - np.tile(self.origin, 2) + (-clearance, -clearance, clearance, clearance):  # Cells with centres in grown box
+			self.blocked[
+				max(0, ceil(x0 / cell_size - 0.5)):max(0, int(x1 / cell_size - 0.5) + 1),
+				max(0, ceil(z0 / cell_size - 0.5)):max(0, int(z1 / cell_size - 0.5) + 1),
+			] = True
+
+		# (cells, 8) flat indices of walkable neighbours, -1 where blocked, outside the grid or cutting a corner
+		ix, iz = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing="ij")
+		nx, nz = ix.reshape(-1, 1) + self.OFFSETS[:, 0], iz.reshape(-1, 1) + self.OFFSETS[:, 1]
+		inside = (nx >= 0) & (nx < self.shape[0]) & (nz >= 0) & (nz < self.shape[1])
+		self.__around = np.where(inside, nx * self.shape[1] + nz, -1)  # Every cell next to each, for __point
+		free = inside & ~self.blocked.reshape(-1)[np.where(inside, self.__around, 0)]
+		for diagonal, (dx, dz) in enumerate(self.OFFSETS[4:], 4):  # Both orthogonal steps of a diagonal must be free
+			free[:, diagonal] &= free[:, self.OFFSETS.tolist().index([dx, 0])] & free[:, self.OFFSETS.tolist().index([0, dz])]
+		self.neighbours = np.where(free, self.__around, -1)
+		self.offsets = self.OFFSETS / np.linalg.norm(self.OFFSETS, axis=1, keepdims=True)  # Unit directions to neighbours
+		self.__beside = self.offsets @ self.offsets.T > 0.7  # Neighbours at most 45 degrees apart, for __point
+
+		self.target = -1  # Walkable cell distances are measured from, -1 before the first update
+		self.__target_cell = -1  # Cell the target was in, blocked when standing close to a wall
+		self.distances = np.full(self.cells, np.inf)
+		self.directions = np.zeros((self.cells, 2))  # Unit direction on the floor plan per cell, zero where there's no way
+		self.__marks = np.zeros(self.cells, bool)  # Scratch for __spread
+		self.full_updates = 0  # Updates since creation that started over, and ones that repaired the last field
+		self.repairs = 0
+
+	def cell(self, pos: Vec) -> int:  # Index of cell containing pos, -1 when outside the grid
+		ix, iz = int((pos.x - self.origin[0]) // self.cell_size), int((pos.z - self.origin[1]) // self.cell_size)
+		if 0 <= ix < self.shape[0] and 0 <= iz < self.shape[1]:
+			return ix * self.shape[1] + iz
+		return -1
+
+	# Measures distances from target's cell, returns whether they changed. Nothing is done while target stays in a
+	# walkable cell or leaves the grid. Close to a wall target's cell is blocked, distances are then measured from the closest
+	# walkable cell next to it on target's side of the wall. After a step between neighbouring walkable cells, no distance
+	# changes by more than one step, so the last field plus one is kept as a bound and only cells that got closer are
+	# visited again. Directions only change next to those, elsewhere every distance went up by one.
+	def update(self, target: Vec) -> bool:
+		cell = self.cell(target)
+		blocked = cell >= 0 and self.blocked.reshape(-1)[cell]
+		if cell < 0 or (cell == self.__target_cell and not blocked):  # Closest walkable cell changes within a blocked one
+			return False
+		self.__target_cell = cell
+		if blocked and (cell := self.__walkable_near(target, cell)) < 0:
+			return False
+		if cell == self.target:
+			return False
+		repair = self.target >= 0 and cell in self.neighbours[self.target]
+		if repair:
+			self.distances += 1
+			self.repairs += 1
+		else:
+			self.distances[:] = np.inf
+			self.full_updates += 1
+		self.target = cell
+		self.distances[cell] = 0
+		lowered = self.__spread(np.array([cell]))
+		if repair:
+			around = self.__around[lowered].reshape(-1)
+			self.__marks[lowered] = self.__marks[around[around >= 0]] = True
+			changed = np.flatnonzero(self.__marks)
+			self.__marks[changed] = False
+			self.__point(changed)
+		else:
+			self.__point(np.arange(self.cells))
+		return True
+
+	def forget(self):  # Next update measures distances from scratch
+		self.target = self.__target_cell = -1
+
+	# Walkable cell next to blocked cell closest to pos, not across a wall from it. -1 if there is none.
+	def __walkable_near(self, pos: Vec, cell: int) -> int:
+		around = self.__around[cell]
+		around = around[(around >= 0) & ~self.blocked.reshape(-1)[np.maximum(around, 0)]]
+		if not len(around):
+			return -1
+		point = np.array([pos.x, pos.z])
+		centres = self.origin + (np.stack(np.divmod(around, self.shape[1]), axis=1) + 0.5) * self.cell_size
+		offsets = centres - point
+		with np.errstate(divide="ignore", invalid="ignore"):  # Segments from pos to each centre against every wall, slab test
+			inverse = 1 / offsets[:, None]
+			t0, t1 = (self.boxes[None, :, :2] - point) * inverse, (self.boxes[None, :, 2:] - point) * inverse
+		t_near = np.fmax(np.fmin(t0[..., 0], t1[..., 0]), np.fmin(t0[..., 1], t1[..., 1]))
+		t_far = np.fmin(np.fmax(t0[..., 0], t1[..., 0]), np.fmax(t0[..., 1], t1[..., 1]))
+		crossed = ((t_near <= t_far) & (t_far >= 0) & (t_near <= 1)).any(axis=1)
+		gaps = np.where(crossed, np.inf, np.linalg.norm(offsets, axis=1))
+		return int(around[gaps.argmin()]) if np.isfinite(gaps.min()) else -1
+
+	def __spread(self, frontier: np.ndarray) -> np.ndarray:  # Breadth first from frontier, lowering distances of cells reached sooner
+		distance = self.distances[frontier[0]]
+		lowered = [frontier]
+		while len(frontier):
+			distance += 1
+			reached = self.neighbours[frontier].reshape(-1)
+			reached = reached[reached >= 0]
+			reached = reached[self.distances[reached] > distance]
+			self.distances[reached] = distance
+			self.__marks[reached] = True  # Cells are reached from several neighbours, marks keep one of each
+			frontier = np.flatnonzero(self.__marks)
+			self.__marks[frontier] = False
+			lowered.append(frontier)
+		return np.concatenate(lowered)
+
+	def __point(self, cells: np.ndarray):  # Cells point at their neighbours with the lowest distance, if lower than their own
+		neighbours = self.neighbours[cells]
+		neighbours = np.where(neighbours >= 0, self.distances[neighbours], np.inf)
+		first = neighbours.argmin(axis=1)
+		lowest = neighbours[np.arange(len(cells)), first, None]
+		# Ties next to the first are averaged, open floor then leads straight-ish. Ties further apart are on either side
+		# of something in the way, their average would lead into it.
+		towards = (neighbours == lowest) & (lowest < self.distances[cells, None]) & (self.__beside[first])
+		directions = towards.astype(np.float64) @ self.offsets
+		length = np.linalg.norm(directions, axis=1, keepdims=True)
+		self.directions[cells] = np.divide(directions, length, out=np.zeros_like(directions), where=length > 0)
+
+	# (N, 2) directions on the floor plan at (N, 3) points, zero off the grid. Points in blocked cells take the direction
+	# of the closest walkable cell around them instead. Imps keep clear of walls, so that cell is on their side of it,
+	# while the blocked cell may lead through the wall.
+	def sample(self, points: np.ndarray) -> np.ndarray:
+		flat = points[:, [0, 2]] - self.origin
+		ix, iz = (flat // self.cell_size).astype(int).T
+		inside = (ix >= 0) & (ix < self.shape[0]) & (iz >= 0) & (iz < self.shape[1])
+		cells = np.where(inside, ix * self.shape[1] + iz, 0)
+		if (stuck := inside & self.blocked.reshape(-1)[cells]).any():
+			around = self.__around[cells[stuck]]
+			walkable = (around >= 0) & ~self.blocked.reshape(-1)[around] & np.isfinite(self.distances[around])
+			centres = (np.stack((ix[stuck], iz[stuck]), axis=1)[:, None] + self.OFFSETS + 0.5) * self.cell_size
+			gaps = np.where(walkable, np.linalg.norm(centres - flat[stuck, None], axis=2), np.inf)
+			closest = gaps.argmin(axis=1)
+			cells[stuck] = np.where(walkable.any(axis=1), around[np.arange(len(around)), closest], cells[stuck])
+		directions = self.directions[cells]
+		directions[~inside] = 0
+		return directions
@@ -0,0 +1,96 @@
+from OpenGL.GL import *
+
+from GameObject import GameObject
+from Culling import Frustum
+from Vec import Vec
+
+import numpy as np
+
+
+# Collects objects to draw over a frame and draws them in an order that changes as little state as possible.
+# Opaque objects are sorted by shader variant, texture and material, then front to back to save on overdraw.
+# Transparent objects are drawn after them back to front, overlay objects last on a cleared depth buffer in submit order.
+# With depth_prepass, opaque objects are first drawn depth only, then lit with an equal depth test so every pixel is
+# shaded once, which pays off when fragments are expensive, e.g. many lights on a software rasterizer.
+class RenderQueue:
+	OPAQUE, TRANSPARENT, OVERLAY = 0, 1, 2
+
+	def __init__(self, depth_prepass: bool = False):
+		self.depth_prepass = depth_prepass
+		self.__layers: list[list[tuple]] = [[], [], []]  # (sort key, object, texture, lights) per layer
+		self.__eye = np.zeros(3, np.float32)
+		self.__frustum: Frustum | None = None
+		self.draws = 0  # Counters since end_frame
+		self.depth_draws = 0
+		self.texture_binds = 0
+		self.material_changes = 0
+		self.frame_stats = {"draws": 0, "depth_draws": 0, "textures": 0, "materials": 0}  # Counters of last finished frame
+
+	def begin(self, eye: Vec, frustum: Frustum = None):  # Objects submitted after are culled against frustum
+		self.__eye[:] = [*eye]
+		self.__frustum = frustum
+		for layer in self.__layers:
+			layer.clear()
+
+	@staticmethod
+	def material_key(ob: GameObject) -> tuple:  # Equal materials share a key even if they're separate objects
+		diff, spec, amb, shine = ob.material
+		return (*diff, *spec, *amb, shine)
+
+	def submit(self, ob: GameObject, texture: int, layer: int = OPAQUE):  # Queues ob to be drawn with texture bound
+		if layer != self.OVERLAY and self.__frustum is not None and not ob.cull(self.__frustum):
+			return
+		lights = ob.pick_lights()
+		lo, hi = ob.bounds()
+		depth = float(np.linalg.norm((np.asarray(lo) + hi) / 2 - self.__eye))
+		if layer == self.OPAQUE:
+			key = (len(lights), texture, self.material_key(ob), depth)
+		elif layer == self.TRANSPARENT:
+			key = (-depth,)
+		else:
+			key = (len(self.__layers[layer]),)
+		self.__layers[layer].append((key, ob, texture, lights))
+
+	def depth_pass(self, items: list[tuple]):  # Fills depth buffer with items, colour is left untouched
+		if not items:
+			return
+		shader = items[0][1].coord.shader
+		glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+		shader.begin_depth_pass()
+		for _, ob, _, lights in items:
+			ob.draw_set(lights)
+			self.depth_draws += 1
+		shader.end_depth_pass()
+		glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+		glDepthFunc(GL_EQUAL)  # Only the closest fragment of each pixel passes in the lit pass
+		glDepthMask(GL_FALSE)
+
+	def flush(self):  # Draws everything submitted since begin
+		texture, material = None, None
+		for layer, items in enumerate(self.__layers):
+			items.sort(key=lambda item: item[0])
+			if layer == self.OPAQUE and self.depth_prepass:
+				self.depth_pass(items)
+			elif layer == self.TRANSPARENT and self.depth_prepass:
+				glDepthFunc(GL_LESS)
+				glDepthMask(GL_TRUE)
+			if layer == self.OVERLAY and items:
+				glClear(GL_DEPTH_BUFFER_BIT)  # Overlay is drawn on top of everything
+			for _, ob, ob_texture, lights in items:
+				if ob_texture != texture:
+					glBindTexture(GL_TEXTURE_2D, ob_texture)
+					texture = ob_texture
+					self.texture_binds += 1
+				if (ob_material := self.material_key(ob)) != material:
+					material = ob_material
+					self.material_changes += 1
+				ob.draw_set(lights)
+				self.draws += 1
+			items.clear()
+
+	def end_frame(self):  # Stores counters of the frame in frame_stats and starts counting again
+		self.frame_stats = {
+			"draws": self.draws, "depth_draws": self.depth_draws,
+			"textures": self.texture_binds, "materials": self.material_changes
+		}
+		self.draws = self.depth_draws = self.texture_binds = self.material_changes = 0
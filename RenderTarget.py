@@ -0,0 +1,85 @@
+from OpenGL.GL import *
+
+from Vec import Vec
+
+from collections import deque
+from math import sqrt
+
+
+# Offscreen framebuffer with a colour texture and depth buffer, drawn into at a fraction of its full size.
+# Storage is allocated once at full size, changing scale only changes the part of it in use.
+class RenderTarget:
+	def __init__(self, size: Vec):
+		self.size = Vec(int(size.x), int(size.y))
+		self.scale = 1.0
+		self.fbo = glGenFramebuffers(1)
+		glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+		self.color = glGenTextures(1)
+		glBindTexture(GL_TEXTURE_2D, self.color)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.size.x, self.size.y, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+		glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.color, 0)
+
+		self.depth = glGenRenderbuffers(1)
+		glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+		glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.size.x, self.size.y)
+		glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+
+		status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+		glBindTexture(GL_TEXTURE_2D, 0)
+		glBindFramebuffer(GL_FRAMEBUFFER, 0)
+		assert status == GL_FRAMEBUFFER_COMPLETE, f"Render target incomplete, status {status}"
+
+	@property
+	def viewport(self) -> tuple[int, int]:  # Size of the part drawn into at the current scale
+		return max(1, round(self.size.x * self.scale)), max(1, round(self.size.y * self.scale))
+
+	def bind(self):  # Following draws go to the scaled part of the target
+		glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+		glViewport(0, 0, *self.viewport)
+
+	def resolve(self):  # Stretches the drawn part over the window and binds the window again
+		width, height = self.viewport
+		glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+		glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+		glBlitFramebuffer(0, 0, width, height, 0, 0, self.size.x, self.size.y, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+		glBindFramebuffer(GL_FRAMEBUFFER, 0)
+		glViewport(0, 0, self.size.x, self.size.y)
+
+	def delete(self):
+		glDeleteFramebuffers(1, [self.fbo])
+		glDeleteTextures([self.color])
+		glDeleteRenderbuffers(1, [self.depth])
+
+
+# Picks a resolution scale from a rolling average of draw times, lower when drawing takes longer than target.
+# Pixel count goes with the square of scale, so scale is corrected by the square root of target / average.
+class ResolutionScaler:
+	def __init__(self, target: float, min_scale: float = 0.5, max_scale: float = 1.0, window: int = 30, headroom: float = 0.9):
+		self.target = target  # Seconds per frame
+		self.min_scale = min_scale
+		self.max_scale = max_scale
+		self.headroom = headroom  # Aim a little under target so small spikes don't drop frames
+		self.times = deque(maxlen=window)
+		self.scale = max_scale
+		self.changes = 0
+
+	@property
+	def average(self) -> float:
+		return sum(self.times) / len(self.times) if self.times else 0.0
+
+	# Adds the time a frame took to draw and returns the scale to use. Scale is adjusted once per full window of frames,
+	# each step by at most 10% so a single slow window doesn't throw it to the minimum.
+	def update(self, frame_time: float) -> float:
+		self.times.append(frame_time)
+		if len(self.times) < self.times.maxlen:
+			return self.scale
+		step = min(1.1, max(0.9, sqrt(self.target * self.headroom / max(self.average, 1e-6))))
+		scale = min(self.max_scale, max(self.min_scale, self.scale * step))
+		if abs(scale - self.scale) >= 0.01:  # Ignore tiny corrections, they'd only blur differently each window
+			self.scale = scale
+			self.changes += 1
+		self.times.clear()
+		return self.scale
@@ -2,81 +2,272 @@ from OpenGL.GL import *
 
 from Vec import Vec
 
+import numpy as np
+
+import hashlib
+import os
+import struct
+
 
 class ShaderError(Exception): pass
 
 
-class Shader3D:
-	def __init__(self):
+# One compiled variant of simple3D.vert / simple3D.frag, or other shader files, with its uniform locations and their
+# last values. Linked programs are cached in CACHE_DIR by source and driver, later launches load them instead of compiling.
+class ShaderProgram:
+	CACHE_DIR = "cache"
+
+	def __init__(self, defines: dict, vert_file: str = "simple3D.vert", frag_file: str = "simple3D.frag"):
+		self.defines = defines
+		vert_source = self.load_source(vert_file, defines)
+		frag_source = self.load_source(frag_file, defines)
+
+		self.program_id = glCreateProgram()
+		path = self.cache_path(vert_source, frag_source)
+		self.from_cache = self.load_binary(path)
+		if not self.from_cache:
+			self.compile(vert_source, frag_source)
+			self.save_binary(path)
+
+		if (block := glGetUniformBlockIndex(self.program_id, "Lights")) != GL_INVALID_INDEX:
+			glUniformBlockBinding(self.program_id, block, Shader3D.LIGHTS_BINDING)
+
+		self.locs: dict[str, int] = {}  # Uniform locations by name, looked up on first use
+		self.values: dict[int, tuple | bytes] = {}  # Last values set per uniform location
+
+	def compile(self, vert_source: str, frag_source: str):
 		vert_shader = glCreateShader(GL_VERTEX_SHADER)
-		with open("simple3D.vert") as shader_file:
-			glShaderSource(vert_shader, shader_file.read())
+		glShaderSource(vert_shader, vert_source)
 		glCompileShader(vert_shader)
 		if glGetShaderiv(vert_shader, GL_COMPILE_STATUS) != 1:  # shader didn't compile
 			print("Couldn't compile vertex shader\nShader compilation Log:\n" + str(glGetShaderInfoLog(vert_shader)))
 
 		frag_shader = glCreateShader(GL_FRAGMENT_SHADER)
-		with open("simple3D.frag") as shader_file:
-			glShaderSource(frag_shader, shader_file.read())
+		glShaderSource(frag_shader, frag_source)
 		glCompileShader(frag_shader)
 		if glGetShaderiv(frag_shader, GL_COMPILE_STATUS) != 1:  # shader didn't compile
 			print("Couldn't compile fragment shader\nShader compilation Log:\n" + str(glGetShaderInfoLog(frag_shader)))
 
-		self.program_id = glCreateProgram()
 		glAttachShader(self.program_id, vert_shader)
 		glAttachShader(self.program_id, frag_shader)
+		for loc, name in self.attributes():
+			glBindAttribLocation(self.program_id, loc, name)
+		glBindFragDataLocation(self.program_id, 0, "frag_color")
+		glProgramParameteri(self.program_id, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
 		glLinkProgram(self.program_id)
-
-		self.pos_loc = glGetAttribLocation(self.program_id, "a_position")
-		glEnableVertexAttribArray(self.pos_loc)
-
-		self.norm_loc = glGetAttribLocation(self.program_id, "a_normal")
-		glEnableVertexAttribArray(self.norm_loc)
-
-		self.uv_loc = glGetAttribLocation(self.program_id, "a_uv")
-		glEnableVertexAttribArray(self.uv_loc)
-
-		self.light_pos_loc = [glGetUniformLocation(self.program_id, f"u_light_position[{x}]") for x in range(8)]
-		self.cam_pos_loc = glGetUniformLocation(self.program_id, "u_camera_position")
-
-		self.locs = {  # Generates locations for light and material variables
-			"light": {mb: [glGetUniformLocation(self.program_id, f"light[{x}].{mb}") for x in range(8)] for mb in ["diffuse", "specular", "ambience"]},
-			"material": {mb: glGetUniformLocation(self.program_id, f"material.{mb}") for mb in ["diffuse", "specular", "ambience", "shininess"]}
-		}
-		self.model_matrix_loc = glGetUniformLocation(self.program_id, "u_model_matrix")
-		self.view_matrix_loc = glGetUniformLocation(self.program_id, "u_view_matrix")
-		self.proj_matrix_loc = glGetUniformLocation(self.program_id, "u_projection_matrix")
-		self.diff_tex_loc = glGetUniformLocation(self.program_id, "tex01")
-
-		self.fog_start_loc = glGetUniformLocation(self.program_id, "u_fog_start")
-		self.fog_end_loc = glGetUniformLocation(self.program_id, "u_fog_end")
-		self.fog_color_loc = glGetUniformLocation(self.program_id, "u_fog_color")
+		glDetachShader(self.program_id, vert_shader)
+		glDetachShader(self.program_id, frag_shader)
+		glDeleteShader(vert_shader)
+		glDeleteShader(frag_shader)
+
+	@staticmethod
+	def attributes() -> list[tuple[int, str]]:  # Fixed locations bound before linking
+		return [
+			(Shader3D.POSITION_LOC, "a_position"), (Shader3D.NORMAL_LOC, "a_normal"), (Shader3D.UV_LOC, "a_uv"),
+			(Shader3D.INSTANCE_MATRIX_LOC, "a_instance_matrix"), (Shader3D.INSTANCE_FRAME_LOC, "a_instance_frame"),
+			(Shader3D.BAKED_LOC, "a_baked"), (Shader3D.INSTANCE_LIGHTS_LOC, "a_instance_lights"),
+		]
+
+	def cache_path(self, vert_source: str, frag_source: str) -> str:  # Binaries only work with the driver that made them
+		driver = [glGetString(name) for name in (GL_VENDOR, GL_RENDERER, GL_VERSION)]
+		key = hashlib.sha1(repr([vert_source, frag_source, self.attributes(), driver]).encode()).hexdigest()
+		return os.path.join(self.CACHE_DIR, f"program_{key}.bin")
+
+	def load_binary(self, path: str) -> bool:  # False if there's no binary at path or the driver won't take it
+		if not os.path.exists(path):
+			return False
+		with open(path, "rb") as binary_file:
+			binary_format, = struct.unpack("<I", binary_file.read(4))
+			binary = np.frombuffer(binary_file.read(), np.uint8)
+		try:
+			glProgramBinary(self.program_id, binary_format, binary, binary.size)
+		except OpenGL.error.GLError:
+			return False
+		return glGetProgramiv(self.program_id, GL_LINK_STATUS) == GL_TRUE
+
+	def save_binary(self, path: str):
+		length = glGetProgramiv(self.program_id, GL_PROGRAM_BINARY_LENGTH)
+		if glGetProgramiv(self.program_id, GL_LINK_STATUS) != GL_TRUE or not length:  # Driver has no binary formats
+			return
+		binary, written, binary_format = np.zeros(length, np.uint8), np.zeros(1, np.int32), np.zeros(1, np.uint32)
+		glGetProgramBinary(self.program_id, length, written, binary_format, binary)
+		os.makedirs(self.CACHE_DIR, exist_ok=True)
+		with open(path, "wb") as binary_file:
+			binary_file.write(struct.pack("<I", binary_format[0]))
+			binary_file.write(binary[:written[0]].tobytes())
+
+	@staticmethod
+	def load_source(path: str, defines: dict) -> str:  # Reads shader source, defines go right after its #version line
+		with open(path) as shader_file:
+			version, _, body = shader_file.read().partition("\n")
+		return "\n".join([version, *(f"#define {name} {value}" for name, value in defines.items()), body])
+
+	def loc(self, name: str) -> int:
+		if (loc := self.locs.get(name)) is None:
+			loc = self.locs[name] = glGetUniformLocation(self.program_id, name)
+		return loc
 
 	def use(self):
-		try: glUseProgram(self.program_id)   
+		try: glUseProgram(self.program_id)
 		except OpenGL.error.GLError as e:
 			raise ShaderError(f"{e}\n{glGetProgramInfoLog(self.program_id)}")
 
+
+# Shader variants compiled for 1, 2, 4 ... lights per draw, used through one interface.
+# Uniform calls go to the variant in use, view, projection, camera and fog are shared and follow every switch.
+class Shader3D:
+	POSITION_LOC, NORMAL_LOC, UV_LOC = 0, 1, 2  # Fixed attribute locations, shared by every vertex array object
+	INSTANCE_MATRIX_LOC, INSTANCE_FRAME_LOC = 3, 7  # Per-instance attributes, matrix takes up locations 3 to 6
+	BAKED_LOC = 8  # Static light baked into vertices, see StaticBatch
+	INSTANCE_LIGHTS_LOC = 9  # Lights picked per instance, see pick_instance_lights. Two columns, locations 9 and 10
+	INSTANCE_LIGHTS = 8  # Most lights per instance, instanced draws use the smallest variant looping over as many
+	MAX_FRAMES = 16  # Size of frame uv rectangle table for instanced draws
+	LIGHTS_BINDING = 0  # Uniform buffer binding point of the Lights block
+
+	# light_capacity must match the LightManager feeding the shader, light_variants are the MAX_LIGHTS compiled for
+	def __init__(self, light_capacity: int = 8, light_variants=(1, 2, 4, 8)):
+		self.light_capacity = light_capacity
+		self.programs = {
+			count: ShaderProgram({"LIGHT_CAPACITY": light_capacity, "MAX_LIGHTS": count})
+			for count in sorted(min(count, light_capacity) for count in set(light_variants))
+		}
+		self.max_lights = max(self.programs)
+		self.program = self.programs[self.max_lights]
+		self.depth_program = ShaderProgram({"LIGHT_CAPACITY": light_capacity, "MAX_LIGHTS": 1, "DEPTH_ONLY": 1})
+		self.depth_only = False  # Whether draws go to depth_program, see begin_depth_pass
+		self.lights = None  # LightManager picking lights per draw, every light is used until one is set
+		self.__shared: dict[str, tuple] = {}  # Uniforms shared by all variants, name -> (setter, values)
+
+		self.uniform_updates = 0  # Uniform calls issued and skipped since end_frame
+		self.uniform_skips = 0
+		self.program_switches = 0  # Variant changes since end_frame
+		self.frame_stats = {"updated": 0, "skipped": 0, "switches": 0}  # Counters of last finished frame
+
+	@property
+	def program_id(self) -> int:
+		return self.program.program_id
+
+	def __set_uniform(self, setter, name, *values):  # Calls setter unless uniform already holds values
+		loc = self.program.loc(name)
+		if self.program.values.get(loc) == values:
+			self.uniform_skips += 1
+			return
+		self.program.values[loc] = values
+		self.uniform_updates += 1
+		setter(loc, *values)
+
+	def __set_uniform_array(self, setter, name, array: np.ndarray, *args):  # Same for arrays, compared by content
+		loc = self.program.loc(name)
+		if self.program.values.get(loc) == (key := array.tobytes()):
+			self.uniform_skips += 1
+			return
+		self.program.values[loc] = key
+		self.uniform_updates += 1
+		setter(loc, *args, array)
+
+	def __set_shared(self, setter, name, *values):  # Sets uniform in the variant in use and remembers it for the others
+		self.__shared[name] = (setter, values)
+		self.__set_uniform(setter, name, *values)
+
+	def __set_shared_matrix(self, name, matrix_array):
+		matrix_array = np.array(matrix_array, np.float32)  # Copied, matrices are refilled in place
+		self.__shared[name] = (None, matrix_array)
+		self.__set_uniform_array(glUniformMatrix4fv, name, matrix_array, 1, True)
+
+	def end_frame(self):  # Stores uniform counters of the frame in frame_stats and starts counting again
+		self.frame_stats = {"updated": self.uniform_updates, "skipped": self.uniform_skips, "switches": self.program_switches}
+		self.uniform_updates = self.uniform_skips = self.program_switches = 0
+
+	def use(self, program: ShaderProgram = None):  # Switches to program, the variant in use by default
+		program = self.program if program is None else program
+		program.use()
+		if program is self.program:
+			return
+		self.program = program
+		self.program_switches += 1
+		for name, (setter, values) in self.__shared.items():
+			if setter is None:
+				self.__set_uniform_array(glUniformMatrix4fv, name, values, 1, True)
+			else:
+				self.__set_uniform(setter, name, *values)
+
+	def begin_depth_pass(self):  # Draws only write depth until end_depth_pass, lights are ignored
+		self.depth_only = True
+		self.use(self.depth_program)
+
+	def end_depth_pass(self):  # Next use_lights switches back to a lit variant
+		self.depth_only = False
+
+	# Picks at most max_lights lights for the box lo - hi, padded with -1 to the smallest variant fitting them.
+	# Without a box, or without a light manager, every light is picked for the largest variant.
+	# baked objects carry static light in their vertices, so only dynamic lights are picked for them.
+	def pick_lights(self, lo=None, hi=None, max_lights: int = None, baked: bool = False) -> np.ndarray:
+		max_lights = self.max_lights if max_lights is None else min(max_lights, self.max_lights)
+		if self.lights is None:
+			indices = range(self.max_lights)
+		else:
+			indices = self.lights.select(lo, hi, max_lights, dynamic=baked)
+		return self.pad_lights(indices)
+
+	def pad_lights(self, indices) -> np.ndarray:  # Light indices padded with -1 to the smallest variant fitting them
+		picked = np.full(next(count for count in self.programs if count >= len(indices)), -1, np.int32)
+		picked[:len(indices)] = indices  # -1 marks the end of the selection
+		return picked
+
+	# (N, INSTANCE_LIGHTS) lights for each of N boxes lo - hi, at most max_lights each, padded with -1
+	def pick_instance_lights(self, lo: np.ndarray, hi: np.ndarray, max_lights: int = None, baked: bool = False) -> np.ndarray:
+		max_lights = self.INSTANCE_LIGHTS if max_lights is None else min(max_lights, self.INSTANCE_LIGHTS)
+		picked = np.full((len(lo), self.INSTANCE_LIGHTS), -1, np.int32)
+		if self.lights is None:
+			count = min(max_lights, self.light_capacity)
+			picked[:, :count] = np.arange(count)
+		elif len(lo):
+			picked[:, :max_lights] = self.lights.select_batch(lo, hi, max_lights, dynamic=baked)
+		return picked
+
+	def instanced_lights(self) -> np.ndarray:  # u_lights for instanced draws, lights come from instances instead
+		return self.pad_lights([-1] * min(self.INSTANCE_LIGHTS, self.max_lights))
+
+	def use_lights(self, picked: np.ndarray, baked: bool = False):  # Switches to the variant for lights from pick_lights
+		if self.depth_only:
+			return
+		if self.programs[len(picked)] is not self.program:
+			self.use(self.programs[len(picked)])
+		self.__set_uniform_array(glUniform1iv, "u_lights", picked, len(picked))
+		self.__set_uniform(glUniform1i, "u_baked", baked)
+
 	def set_model_matrix(self, matrix_array):
-		glUniformMatrix4fv(self.model_matrix_loc, 1, True, matrix_array)
+		self.__set_uniform_array(glUniformMatrix4fv, "u_model_matrix", matrix_array, 1, True)
 
 	def set_projection_matrix(self, matrix_array):
-		glUniformMatrix4fv(self.proj_matrix_loc, 1, True, matrix_array)
+		self.__set_shared_matrix("u_projection_matrix", matrix_array)
 
 	def set_view_matrix(self, matrix_array):
-		glUniformMatrix4fv(self.view_matrix_loc, 1, True, matrix_array)
+		self.__set_shared_matrix("u_view_matrix", matrix_array)
 
 	def set_position_attribute(self, vertex_array):
-		glVertexAttribPointer(self.pos_loc, 3, GL_FLOAT, False, 0, vertex_array)
+		glVertexAttribPointer(self.POSITION_LOC, 3, GL_FLOAT, False, 0, vertex_array)
 
 	def set_normal_attribute(self, vertex_array):
-		glVertexAttribPointer(self.norm_loc, 3, GL_FLOAT, False, 0, vertex_array)
+		glVertexAttribPointer(self.NORMAL_LOC, 3, GL_FLOAT, False, 0, vertex_array)
 
 	def set_uv_attribute(self, vertex_array):
-		glVertexAttribPointer(self.uv_loc, 2, GL_FLOAT, False, 0, vertex_array)
+		glVertexAttribPointer(self.UV_LOC, 2, GL_FLOAT, False, 0, vertex_array)
+
+	def set_uv_scale(self, scale):  # Texture tiling, applied to uv coordinates in vertex shader
+		self.__set_uniform(glUniform2f, "u_uv_scale", *scale)
+
+	def set_uv_rect(self, rect):  # Part of texture to draw, [u offset, v offset, u scale, v scale]
+		self.__set_uniform(glUniform4f, "u_uv_rect", *rect)
+
+	def set_instanced(self, instanced: bool):  # Whether model matrix and frame come from instance attributes
+		self.__set_uniform(glUniform1i, "u_instanced", instanced)
+
+	def set_frame_rects(self, rects):  # uv rectangles [u offset, v offset, u scale, v scale] indexed by instance frame
+		self.__set_uniform_array(glUniform4fv, "u_frame_rects", np.asarray(rects, np.float32), len(rects))
 
 	def set_diffuse_texture(self, tex):
-		glUniform1f(self.diff_tex_loc, tex)
+		self.__set_uniform(glUniform1i, "u_tex01", tex)
 
 	def set_material(self, diff, spec, amb, shine):
 		self.set_material_diffuse(diff)
@@ -84,40 +275,22 @@ class Shader3D:
 		self.set_material_ambience(amb)
 		self.set_shininess(shine)
 
-	def set_light(self, diff, spec, amb, pos, ind=0):
-		self.set_light_diffuse(diff, ind)
-		self.set_light_specular(spec, ind)
-		self.set_light_ambience(amb, ind)
-		self.set_light_position(pos, ind)
-
 	def set_material_diffuse(self, diff):
-		glUniform4f(self.locs["material"]["diffuse"], *diff, 1.0)
-
-	def set_light_position(self, pos, ind=0):
-		glUniform4f(self.light_pos_loc[ind], *pos, 1.0)
-
-	def set_light_diffuse(self, diff, ind=0):
-		glUniform4f(self.locs["light"]["diffuse"][ind], *diff, 1.0)
+		self.__set_uniform(glUniform4f, "material.diffuse", *diff, 1.0)
 
 	def set_camera_position(self, pos):
-		glUniform4f(self.cam_pos_loc, *pos, 1.0)
-
-	def set_light_specular(self, spec, ind=0):
-		glUniform4f(self.locs["light"]["specular"][ind], *spec, 1.0)
+		self.__set_shared(glUniform4f, "u_camera_position", *pos, 1.0)
 
 	def set_material_specular(self, spec):
-		glUniform4f(self.locs["material"]["specular"], *spec, 1.0)
+		self.__set_uniform(glUniform4f, "material.specular", *spec, 1.0)
 
 	def set_shininess(self, shine):
-		glUniform1f(self.locs["material"]["shininess"], shine)
-
-	def set_light_ambience(self, amb, ind=0):
-		glUniform4f(self.locs["light"]["ambience"][ind], *amb, 1.0)
+		self.__set_uniform(glUniform1f, "material.shininess", shine)
 
 	def set_material_ambience(self, amb):
-		glUniform4f(self.locs["material"]["ambience"], *amb, 1.0)
+		self.__set_uniform(glUniform4f, "material.ambience", *amb, 1.0)
 
 	def set_fog(self, color: Vec, start: float, end: float):
-		glUniform4f(self.fog_color_loc, *color, 1)
-		glUniform1f(self.fog_start_loc, start)
-		glUniform1f(self.fog_end_loc, end)
+		self.__set_shared(glUniform4f, "u_fog_color", *color, 1)
+		self.__set_shared(glUniform1f, "u_fog_start", start)
+		self.__set_shared(glUniform1f, "u_fog_end", end)
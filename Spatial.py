@@ -0,0 +1,208 @@
+from Vec import Vec
+
+import numpy as np
+
+from math import floor, inf
+
+
+# (N, M) distances along N rays to where they enter M boxes lo - hi, np.inf where they miss.
+# Rays start at origins and go along directions, all (N, 3) or broadcast against the boxes.
+def ray_box_distances(origins: np.ndarray, directions: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+	t_near, t_far = -np.inf, np.inf
+	with np.errstate(divide="ignore", invalid="ignore"):  # Rays parallel to a slab give infinities or nan, fmin/fmax skip nan
+		inverse = 1 / directions
+		for axis in range(3):  # One slab at a time, reducing over the short last axis is slow
+			t0 = (lo[..., axis] - origins[..., axis]) * inverse[..., axis]
+			t1 = (hi[..., axis] - origins[..., axis]) * inverse[..., axis]
+			t_near, t_far = np.fmax(t_near, np.fmin(t0, t1)), np.fmin(t_far, np.fmax(t0, t1))
+	return np.where((t_near <= t_far) & (t_far >= 0), np.maximum(t_near, 0), np.inf)
+
+
+# Uniform grid over the floor plan holding static objects by the cells their boxes overlap.
+# Queries only look at the cells a box overlaps, so they cost the same however many objects the level has.
+class SpatialGrid:
+	# boxes are (N, 3) arrays of lower and upper corners of objects, by default taken from their coord pos and scalar
+	def __init__(self, objects: list, cell_size: float = 2.0, boxes: tuple[np.ndarray, np.ndarray] = None):
+		self.objects = list(objects)
+		self.cell_size = cell_size
+		if boxes is None:
+			pos = np.array([[*ob.coord.pos] for ob in self.objects], np.float64).reshape(-1, 3)
+			half = np.abs(np.array([[*ob.coord.scalar] for ob in self.objects], np.float64).reshape(-1, 3)) / 2
+			boxes = pos - half, pos + half
+		self.__lo, self.__hi = (np.asarray(corner, np.float64).reshape(-1, 3) for corner in boxes)
+		self.__boxes = np.hstack((self.__lo[:, [0, 2]], self.__hi[:, [0, 2]]))  # [x min, z min, x max, z max] on the floor plan
+		self.__ray_boxes = [*zip(self.__lo.tolist(), self.__hi.tolist())]  # Same as plain floats, see raycast
+		self.queries = 0  # Queries and objects returned, rays cast and cells they visited, since reset_counters
+		self.returned = 0
+		self.rays = 0
+		self.cells_visited = 0
+
+		# Dense (x cells, z cells, most objects in a cell) table of objects overlapping each cell, padded with -1
+		lo = np.floor(self.__boxes[:, :2] / cell_size).astype(int)
+		hi = np.floor(self.__boxes[:, 2:] / cell_size).astype(int)
+		self.__offset = lo.min(axis=0) if len(lo) else np.zeros(2, int)
+		shape = (hi.max(axis=0) - self.__offset + 1) if len(hi) else np.ones(2, int)
+		spans = hi - lo + 1
+		counts = spans[:, 0] * spans[:, 1]  # Cells overlapped by each object
+		objects = np.repeat(np.arange(len(counts)), counts)
+		k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		keys = (lo[objects, 0] + k // spans[objects, 1] - self.__offset[0]) * shape[1] + lo[objects, 1] + k % spans[objects, 1] - self.__offset[1]
+		order = np.argsort(keys, kind="stable")  # Objects stay in construction order within a cell
+		keys, objects = keys[order], objects[order]
+		ranks = np.arange(len(keys)) - np.searchsorted(keys, keys)  # Place of each object in its cell
+		table = np.full((shape[0] * shape[1], int(ranks.max(initial=0)) + 1), -1)
+		table[keys, ranks] = objects
+		self.__table = table.reshape(shape[0], shape[1], -1)
+
+	def reset_counters(self):
+		self.queries = self.returned = self.rays = self.cells_visited = 0
+
+	def cell_range(self, x0: float, z0: float, x1: float, z1: float):  # Cells overlapping box, borders included
+		for ix in range(floor(x0 / self.cell_size), floor(x1 / self.cell_size) + 1):
+			for iz in range(floor(z0 / self.cell_size), floor(z1 / self.cell_size) + 1):
+				yield ix, iz
+
+	def cell(self, ix: int, iz: int) -> list[int]:  # Indices of objects overlapping cell
+		ix, iz = ix - self.__offset[0], iz - self.__offset[1]
+		if 0 <= ix < self.__table.shape[0] and 0 <= iz < self.__table.shape[1]:
+			return [ind for ind in self.__table[ix, iz].tolist() if ind >= 0]
+		return []
+
+	def query_box(self, x0: float, z0: float, x1: float, z1: float) -> list:  # Objects in cells the box overlaps
+		found = set()
+		for cell in self.cell_range(x0, z0, x1, z1):
+			found.update(self.cell(*cell))
+		self.queries += 1
+		self.returned += len(found)
+		return [self.objects[ind] for ind in sorted(found)]  # In construction order, collisions resolve as before
+
+	def query(self, old_pos: Vec, new_pos: Vec, margin: float = 0.0) -> list:  # Objects near a move from old_pos to new_pos
+		return self.query_box(
+			min(old_pos.x, new_pos.x) - margin, min(old_pos.z, new_pos.z) - margin,
+			max(old_pos.x, new_pos.x) + margin, max(old_pos.z, new_pos.z) + margin
+		)
+
+	# (N, K) indices of objects in cells each of N boxes [x min, z min, x max, z max] overlaps, padded with -1.
+	# Rows are sorted, a few objects may show up twice when they span several cells.
+	def query_batch(self, boxes: np.ndarray) -> np.ndarray:
+		if not len(boxes):
+			return np.empty((0, 0), int)
+		lo = np.floor(boxes[:, :2] / self.cell_size).astype(int) - self.__offset
+		hi = np.floor(boxes[:, 2:] / self.cell_size).astype(int) - self.__offset
+		span = int((hi - lo).max(initial=0)) + 1  # Every box is looked up in span x span cells from its lowest one
+		steps = np.arange(span)
+		ix = (lo[:, 0, None] + steps)[:, :, None].repeat(span, axis=2)
+		iz = (lo[:, 1, None] + steps)[:, None, :].repeat(span, axis=1)
+		inside = (ix <= hi[:, 0, None, None]) & (iz <= hi[:, 1, None, None])
+		inside &= (ix >= 0) & (ix < self.__table.shape[0]) & (iz >= 0) & (iz < self.__table.shape[1])
+		found = np.where(inside[..., None], self.__table[ix.clip(0, self.__table.shape[0] - 1), iz.clip(0, self.__table.shape[1] - 1)], -1)
+		found = np.sort(found.reshape(len(boxes), -1), axis=1)
+		self.queries += len(boxes)
+		self.returned += int(np.count_nonzero(found >= 0))
+		return found
+
+	# Same as GameHandler.collide_objects for N movers at once, against the objects near them.
+	# old and new are (N, 3) positions before and after moving, new is pushed out of objects in place and returned.
+	def collide_batch(self, old: np.ndarray, new: np.ndarray, radius: float) -> np.ndarray:
+		swept = np.hstack((np.minimum(old, new)[:, [0, 2]] - radius, np.maximum(old, new)[:, [0, 2]] + radius))
+		found = self.query_batch(swept)
+		for column in found.T:  # Objects one at a time like the scalar version, only for movers that have one
+			if not len(rows := np.flatnonzero(column >= 0)):
+				continue
+			x0, z0, x1, z1 = self.__boxes[column[rows]].T
+			ox, oz, nx, nz = old[rows, 0], old[rows, 2], new[rows, 0], new[rows, 2]
+			in_x = (x0 - radius < ox) & (ox < x1 + radius)
+			in_z = (z0 - radius < oz) & (oz < z1 + radius) & ~in_x
+			new[rows, 2] = np.where(in_x, self.__resolve(oz, nz, z0, z1, radius), nz)
+			new[rows, 0] = np.where(in_z, self.__resolve(ox, nx, x0, x1, radius), nx)
+		return new
+
+	@staticmethod
+	def __resolve(old, new, lo, hi, radius):  # Position along one axis after pushing out of [lo, hi]
+		return np.where(
+			old + radius <= lo, np.where(new + radius <= lo, new, lo - radius), np.where(
+				old - radius >= hi, np.where(new - radius >= hi, new, hi + radius),
+				np.where(old < (lo + hi) / 2, lo - radius, hi + radius)
+			)
+		)
+
+	# Cells each of N rays passes through up to max_dist, in order, found with the steps of a grid DDA for all rays at
+	# once: times the rays cross cell borders along x and z are merged and every crossing steps along its axis.
+	# Returns (N, S, 2) cells and (N, S) mask of cells entered within max_dist.
+	def ray_cells(self, origins: np.ndarray, directions: np.ndarray, max_dist: float) -> tuple[np.ndarray, np.ndarray]:
+		flat_origins, flat = origins[:, [0, 2]], directions[:, [0, 2]]
+		cell = np.floor(flat_origins / self.cell_size).astype(int)
+		step = np.sign(flat).astype(int)
+		crossings = np.arange(int(np.ceil(max_dist / self.cell_size)) + 1)  # Most borders a ray crosses along an axis
+		with np.errstate(divide="ignore", invalid="ignore"):
+			t_next = ((cell + (step > 0)) * self.cell_size - flat_origins) / flat
+			times = np.where((step != 0)[..., None], t_next[..., None] + crossings * (self.cell_size / np.abs(flat))[..., None], np.inf)
+		times = times.reshape(len(origins), -1)  # x crossings then z crossings
+		order = np.argsort(times, axis=1)
+		axes = np.arange(2).repeat(len(crossings))[order]
+		moves = np.cumsum(axes[..., None] == np.arange(2), axis=1) * step[:, None]
+		cells = np.concatenate((cell[:, None], cell[:, None] + moves), axis=1)
+		entered = np.concatenate((np.zeros((len(origins), 1)), np.take_along_axis(times, order, axis=1)), axis=1)
+		return cells, entered <= max_dist
+
+	# Nearest object each of N rays hits within max_dist, testing only objects in cells along the rays.
+	# Returns (N,) distances, np.inf for misses, and (N,) indices of the objects hit, -1 for misses.
+	def raycast_batch(self, origins: np.ndarray, directions: np.ndarray, max_dist: float) -> tuple[np.ndarray, np.ndarray]:
+		origins = np.asarray(origins, np.float64).reshape(-1, 3)
+		directions = np.asarray(directions, np.float64).reshape(-1, 3)
+		directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)  # Distances are then along the ray
+		self.rays += len(origins)
+		if not self.objects or not len(origins):
+			return np.full(len(origins), np.inf), np.full(len(origins), -1)
+
+		cells, entered = self.ray_cells(origins, directions, max_dist)
+		ix, iz = np.moveaxis(cells - self.__offset, -1, 0)
+		inside = entered & (ix >= 0) & (ix < self.__table.shape[0]) & (iz >= 0) & (iz < self.__table.shape[1])
+		self.cells_visited += int(np.count_nonzero(inside))
+		found = self.__table[ix.clip(0, self.__table.shape[0] - 1), iz.clip(0, self.__table.shape[1] - 1)]
+		found = np.where(inside[..., None], found, -1).reshape(len(origins), -1)
+		rays, columns = np.nonzero(found >= 0)  # Only slots holding objects, most cells along a ray are empty
+		tested = found[rays, columns]
+		t = np.full(found.shape, np.inf)
+		t[rays, columns] = ray_box_distances(origins[rays], directions[rays], self.__lo[tested], self.__hi[tested])
+		column = t.argmin(axis=1)
+		rows = np.arange(len(origins))
+		best, hit = t[rows, column], found[rows, column]
+		missed = best > max_dist
+		best[missed], hit[missed] = np.inf, -1
+		return best, hit
+
+	# Same as raycast_batch for a single ray, in plain Python as array calls cost more than they save for one ray
+	def raycast(self, origin: Vec, direction: Vec, max_dist: float) -> tuple[float, int]:
+		direction = direction.normalized()
+		self.rays += 1
+		cell = [floor(origin.x / self.cell_size), floor(origin.z / self.cell_size)]
+		flat = (direction.x, direction.z)
+		step = [int(d > 0) - int(d < 0) for d in flat]
+		t_next = [((c + (s > 0)) * self.cell_size - o) / d if s else inf for c, s, o, d in zip(cell, step, (origin.x, origin.z), flat)]
+		t_delta = [self.cell_size / abs(d) if s else inf for s, d in zip(step, flat)]
+		best, hit, tested = inf, -1, set()
+		while self.objects:
+			for ind in self.cell(*cell):
+				if ind not in tested:
+					tested.add(ind)
+					if (t := self.__ray_box(origin, direction, ind)) < best:
+						best, hit = t, ind
+			self.cells_visited += 1
+			axis = 0 if t_next[0] < t_next[1] else 1
+			if best <= t_next[axis] or t_next[axis] > max_dist:
+				break
+			cell[axis] += step[axis]
+			t_next[axis] += t_delta[axis]
+		return (best, hit) if best <= max_dist else (inf, -1)
+
+	def __ray_box(self, origin: Vec, direction: Vec, ind: int) -> float:  # Distance along ray to object ind, inf if missed
+		t_near, t_far = -inf, inf
+		for o, d, lo, hi in zip(origin, direction, *self.__ray_boxes[ind]):
+			if d == 0:
+				if not lo <= o <= hi:  # Parallel to the slab and outside of it
+					return inf
+				continue
+			t0, t1 = (lo - o) / d, (hi - o) / d
+			t_near, t_far = max(t_near, min(t0, t1)), min(t_far, max(t0, t1))
+		return max(t_near, 0.0) if t_near <= t_far and t_far >= 0 else inf
@@ -0,0 +1,133 @@
+import pygame as pg
+
+from OpenGL.GL import *
+
+from Shader import Shader3D, ShaderProgram
+from Vec import Vec
+
+import numpy as np
+
+import ctypes
+
+
+# Glyphs of a font rasterized once into one texture, white with coverage in alpha.
+# Fonts are loaded once per (file, size), see shared.
+class FontAtlas:
+	__shared: dict = {}  # Atlases by (file, size)
+	CHARACTERS = "".join(chr(code) for code in range(32, 127))  # Printable ASCII, others are drawn as "?"
+
+	def __init__(self, font_file: str, size: int):
+		font = pg.font.Font(font_file, size)
+		glyphs = {char: font.render(char, True, (255, 255, 255)) for char in self.CHARACTERS}
+		self.height = font.get_height()
+		self.width = sum(glyph.get_width() for glyph in glyphs.values())
+
+		# One row of glyphs, rects are [u0, v0, u1, v1] with v0 at the glyph's top and sizes in pixels
+		surface = pg.Surface((self.width, self.height), pg.SRCALPHA)
+		surface.fill((255, 255, 255, 0))
+		self.rects: dict[str, tuple[float, float, float, float]] = {}
+		self.sizes: dict[str, tuple[int, int]] = {}
+		x = 0
+		for char, glyph in glyphs.items():
+			surface.blit(glyph, (x, 0))
+			self.rects[char] = (x / self.width, 0.0, (x + glyph.get_width()) / self.width, glyph.get_height() / self.height)
+			self.sizes[char] = glyph.get_size()
+			x += glyph.get_width()
+
+		self.tex_id = glGenTextures(1)
+		glBindTexture(GL_TEXTURE_2D, self.tex_id)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)  # Drawn 1:1, no filtering needed
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+		glTexImage2D(
+			GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+			pg.image.tostring(surface, "RGBA")  # Top row first, so v grows downwards
+		)
+
+	@classmethod
+	def shared(cls, font_file: str, size: int) -> "FontAtlas":
+		if (atlas := cls.__shared.get((font_file, size))) is None:
+			atlas = cls.__shared[(font_file, size)] = cls(font_file, size)
+		return atlas
+
+	def quads(self, text: str, position: Vec) -> np.ndarray:  # Two triangles per glyph, [x, y, u, v] per vertex
+		vertices = np.empty((len(text), 6, 4), np.float32)
+		x = position.x
+		for ind, char in enumerate(text):
+			char = char if char in self.rects else "?"
+			u0, v0, u1, v1 = self.rects[char]
+			width, height = self.sizes[char]
+			x0, y0, x1, y1 = x, position.y, x + width, position.y + height
+			vertices[ind] = (
+				(x0, y0, u0, v1), (x1, y0, u1, v1), (x1, y1, u1, v0),
+				(x0, y0, u0, v1), (x1, y1, u1, v0), (x0, y1, u0, v0),
+			)
+			x += width
+		return vertices.reshape(-1, 4)
+
+
+# A string drawn at a fixed window position, its quads are rebuilt and uploaded only when the string changes
+class TextLabel:
+	def __init__(self, atlas: FontAtlas, position: Vec, color: Vec):
+		self.atlas = atlas
+		self.position = position
+		self.color = color
+		self.text: str | None = None
+		self.count = 0  # Vertices uploaded
+		self.rebuilds = 0
+
+		self.vao = glGenVertexArrays(1)
+		glBindVertexArray(self.vao)
+		self.vbo = glGenBuffers(1)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		for loc, offset in ((Shader3D.POSITION_LOC, 0), (Shader3D.UV_LOC, 8)):
+			glEnableVertexAttribArray(loc)
+			glVertexAttribPointer(loc, 2, GL_FLOAT, False, 16, ctypes.c_void_p(offset))
+		glBindVertexArray(0)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+	def set_text(self, text: str):
+		if text == self.text:
+			return
+		self.text = text
+		vertices = self.atlas.quads(text, self.position)
+		self.count = len(vertices)
+		self.rebuilds += 1
+		glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+		glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_DYNAMIC_DRAW)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+	def draw(self):
+		if self.count:
+			glBindVertexArray(self.vao)
+			glDrawArrays(GL_TRIANGLES, 0, self.count)
+
+
+# Draws labels with text.vert / text.frag over whatever is in the window, one draw call per label.
+# shader is used again afterwards, so draws through it carry on as if nothing happened.
+class TextRenderer:
+	def __init__(self, bounds: Vec, shader: Shader3D):
+		self.shader = shader
+		self.program = ShaderProgram({}, "text.vert", "text.frag")
+		self.program.use()
+		glUniform2f(self.program.loc("u_screen_size"), bounds.x, bounds.y)
+		glUniform1i(self.program.loc("u_atlas"), 0)
+		self.shader.use()
+		self.labels: dict[tuple, TextLabel] = {}  # Labels by font, size, position and color, see label
+
+	def label(self, position: Vec, color: Vec, size: int, font_file: str) -> TextLabel:  # Made on first use
+		key = (font_file, size, *position, *color)
+		if (label := self.labels.get(key)) is None:
+			label = self.labels[key] = TextLabel(FontAtlas.shared(font_file, size), position, color)
+		return label
+
+	def draw(self, labels: list[TextLabel]):
+		self.program.use()
+		glDisable(GL_DEPTH_TEST)
+		for label in labels:
+			glBindTexture(GL_TEXTURE_2D, label.atlas.tex_id)
+			glUniform4f(self.program.loc("u_color"), *(channel / 255 for channel in label.color), 1.0)
+			label.draw()
+		glEnable(GL_DEPTH_TEST)
+		self.shader.use()
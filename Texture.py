@@ -0,0 +1,50 @@
+import pygame as pg
+
+from OpenGL.GL import *
+
+import numpy as np
+
+
+# Packs several images into one texture, each image is then selected by its uv rectangle
+class TextureAtlas:
+	def __init__(self, paths: dict[str, str], padding: int = 1):
+		images = {}
+		for name, path in paths.items():
+			surface = pg.image.load(path)
+			pixels = np.frombuffer(pg.image.tostring(surface, "RGBA", False), np.uint8)
+			pixels = pixels.reshape(surface.get_height(), surface.get_width(), 4)
+			# Repeats border pixels so filtering at the edge of an image doesn't bleed into its neighbours
+			images[name] = np.pad(pixels, ((padding, padding), (padding, padding), (0, 0)), "edge")
+
+		# Shelf packing, tallest images first, into a power of two wide texture
+		area = sum(image.shape[0] * image.shape[1] for image in images.values())
+		self.width = 1 << (max(int(area ** 0.5), *(image.shape[1] for image in images.values())) - 1).bit_length()
+		x = y = shelf = 0
+		offsets = {}
+		for name in sorted(images, key=lambda n: -images[n].shape[0]):
+			height, width = images[name].shape[:2]
+			if x + width > self.width:  # Next shelf
+				x, y, shelf = 0, y + shelf, 0
+			offsets[name] = (x, y)
+			x += width
+			shelf = max(shelf, height)
+		self.height = 1 << (y + shelf - 1).bit_length()
+
+		pixels = np.zeros((self.height, self.width, 4), np.uint8)
+		self.rects: dict[str, list[float]] = {}  # [u offset, v offset, u scale, v scale], in the order images were given
+		for name in paths:
+			(x, y), (height, width) = offsets[name], images[name].shape[:2]
+			pixels[y:y + height, x:x + width] = images[name]
+			self.rects[name] = [
+				(x + padding) / self.width, (y + padding) / self.height,
+				(width - 2 * padding) / self.width, (height - 2 * padding) / self.height
+			]
+
+		self.tex_id = glGenTextures(1)
+		glBindTexture(GL_TEXTURE_2D, self.tex_id)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+
+	def bind(self):
+		glBindTexture(GL_TEXTURE_2D, self.tex_id)
@@ -0,0 +1,170 @@
+from Vec import Vec
+from Spatial import SpatialGrid
+
+import numpy as np
+
+import hashlib
+import os
+
+from math import ceil
+
+
+# Potentially visible sets of a grid of floor plan cells, precomputed from axis-aligned walls.
+# Cell a can see cell b if a segment between their sample points misses every wall, or b is next to such a cell,
+# walls are boxes on the floor plan.
+# Sets are cached in CACHE_DIR, keyed by the walls and grid, rebuild ignores the cache.
+class VisibilityGrid:
+	CACHE_DIR = "cache"
+	VERSION = 2  # Part of cache key, bump when the precomputation changes
+
+	def __init__(self, walls: list, cell_size: float = 1.5, samples: int = 3, far: float = None, rebuild: bool = False):
+		self.walls = np.array([  # [x min, z min, x max, z max]
+			[wall.coord.pos.x - abs(wall.coord.scalar.x) / 2, wall.coord.pos.z - abs(wall.coord.scalar.z) / 2,
+			 wall.coord.pos.x + abs(wall.coord.scalar.x) / 2, wall.coord.pos.z + abs(wall.coord.scalar.z) / 2]
+			for wall in walls
+		], np.float64)
+		self.cell_size = cell_size
+		self.origin = self.walls[:, :2].min(axis=0)
+		self.shape = tuple(max(1, ceil(size / cell_size)) for size in self.walls[:, 2:].max(axis=0) - self.origin)
+		self.cells = self.shape[0] * self.shape[1]
+
+		key = hashlib.sha1(repr([self.VERSION, self.walls.tolist(), cell_size, samples, far]).encode()).hexdigest()
+		path = os.path.join(self.CACHE_DIR, f"pvs_{key}.npy")
+		if not rebuild and os.path.exists(path):
+			self.pvs = np.load(path)
+		else:
+			self.pvs = self.build(samples, far)
+			os.makedirs(self.CACHE_DIR, exist_ok=True)
+			np.save(path, self.pvs)
+
+		self.__eye_cell = None  # Camera cell of the summed visibility table below
+		self.__summed: np.ndarray | None = None
+
+	def crossed(self, origins: np.ndarray, offsets: np.ndarray) -> np.ndarray:  # Whether each (N, 2) segment from origin to origin + offset crosses a wall
+		x0, z0, x1, z1 = self.walls.T
+		with np.errstate(divide="ignore", invalid="ignore"):  # Segments parallel to an axis give infinities, slab test handles them
+			ix, iz = 1 / offsets[:, 0:1], 1 / offsets[:, 1:2]
+			tx0, tx1 = (x0 - origins[:, 0:1]) * ix, (x1 - origins[:, 0:1]) * ix
+			tz0, tz1 = (z0 - origins[:, 1:2]) * iz, (z1 - origins[:, 1:2]) * iz
+		t_near = np.fmax(np.fmin(tx0, tx1), np.fmin(tz0, tz1))
+		t_far = np.fmin(np.fmax(tx0, tx1), np.fmax(tz0, tz1))
+		return ((t_near < t_far) & (t_far > 0) & (t_near < 1)).any(axis=1)
+
+	# (cells, cells) table, True where b is visible from a. Points are spread over the grid, samples to a cell's side
+	# with borders and corners shared between cells. Segments between every two points within far are tested against
+	# the walls, cells are visible from each other if any segment between their points is clear. Sight lines can still
+	# slip between points, so every visible set is grown by one cell to keep the table conservative.
+	def build(self, samples: int, far: float = None) -> np.ndarray:
+		step = max(1, samples - 1)  # Gaps between points along a cell's side
+		size = (self.shape[0] * step + 1, self.shape[1] * step + 1)
+		ix, iz = np.meshgrid(np.arange(size[0]), np.arange(size[1]), indexing="ij")
+		points = self.origin + np.stack((ix.reshape(-1), iz.reshape(-1)), axis=1) * (self.cell_size / step)
+		pvs = np.identity(self.cells, bool).reshape(self.cells, *self.shape)
+		for p in range(len(points) - 1):
+			others = np.arange(p + 1, len(points))  # Later points only, the table is mirrored below
+			if far is not None:
+				others = others[np.linalg.norm(points[others] - points[p], axis=1) <= far]
+			offsets = points[others] - points[p]
+			clear = np.zeros(len(points), bool)
+			clear[others] = ~self.crossed(np.broadcast_to(points[p], offsets.shape), offsets)
+			clear = clear.reshape(size)
+			seen = np.zeros(self.shape, bool)  # Cells with any clear point, each cell's points are step + 1 to a side
+			for dx in range(step + 1):
+				for dz in range(step + 1):
+					seen |= clear[dx:dx + self.shape[0] * step:step, dz:dz + self.shape[1] * step:step]
+			px, pz = divmod(p, size[1])  # Cells p lies in, up to four on borders and corners
+			cells_x = np.unique(np.clip([(px - 1) // step, px // step], 0, self.shape[0] - 1))
+			cells_z = np.unique(np.clip([(pz - 1) // step, pz // step], 0, self.shape[1] - 1))
+			for cx in cells_x:
+				pvs[cx * self.shape[1] + cells_z] |= seen
+		pvs = pvs.reshape(self.cells, self.cells)
+		pvs = (pvs | pvs.T).reshape(self.cells, *self.shape)  # Visibility goes both ways
+		grown = pvs.copy()  # Each visible set grown by one cell, diagonals included
+		for dx in (-1, 0, 1):
+			for dz in (-1, 0, 1):
+				grown[:, max(dx, 0):self.shape[0] + min(dx, 0), max(dz, 0):self.shape[1] + min(dz, 0)] |= \
+					pvs[:, max(-dx, 0):self.shape[0] + min(-dx, 0), max(-dz, 0):self.shape[1] + min(-dz, 0)]
+		grown = grown.reshape(self.cells, self.cells)
+		return grown | grown.T
+
+	def cell(self, pos: Vec) -> int:  # Index of cell containing pos, -1 when outside the grid
+		ix, iz = int((pos.x - self.origin[0]) // self.cell_size), int((pos.z - self.origin[1]) // self.cell_size)
+		if 0 <= ix < self.shape[0] and 0 <= iz < self.shape[1]:
+			return ix * self.shape[1] + iz
+		return -1
+
+	def sees(self, a: Vec, b: Vec) -> bool:  # Whether b's cell is potentially visible from a's, always True outside grid
+		cell_a, cell_b = self.cell(a), self.cell(b)
+		return cell_a < 0 or cell_b < 0 or bool(self.pvs[cell_a, cell_b])
+
+	def sees_batch(self, a: Vec, points: np.ndarray) -> np.ndarray:  # Mask of (N, 3) points whose cells a's cell may see
+		if (cell_a := self.cell(a)) < 0:
+			return np.ones(len(points), bool)
+		ix, iz = ((points[:, [0, 2]] - self.origin) // self.cell_size).astype(int).T
+		inside = (ix >= 0) & (ix < self.shape[0]) & (iz >= 0) & (iz < self.shape[1])
+		cells = np.where(inside, ix * self.shape[1] + iz, 0)
+		return ~inside | self.pvs[cell_a, cells]
+
+	def boxes_visible(self, lo: np.ndarray, hi: np.ndarray, eye: Vec) -> np.ndarray:  # Mask of (N, 3) boxes touching a cell visible from eye
+		eye_cell = self.cell(eye)
+		if eye_cell < 0:
+			return np.ones(len(lo), bool)
+		if eye_cell != self.__eye_cell:  # Summed table of visible cells, any box is then tested with four lookups
+			self.__eye_cell = eye_cell
+			self.__summed = np.zeros((self.shape[0] + 1, self.shape[1] + 1), np.int32)
+			self.__summed[1:, 1:] = self.pvs[eye_cell].reshape(self.shape).cumsum(axis=0).cumsum(axis=1)
+		limit = np.array(self.shape) - 1
+		margin = self.cell_size / 4  # Boxes are grown a little, faces of walls often lie right on the border of a cell
+		x0, z0 = np.clip(((lo[:, [0, 2]] - margin - self.origin) // self.cell_size).astype(int), 0, limit).T
+		x1, z1 = np.clip(((hi[:, [0, 2]] + margin - self.origin) // self.cell_size).astype(int), 0, limit).T + 1
+		s = self.__summed
+		return s[x1, z1] - s[x0, z1] - s[x1, z0] + s[x0, z0] > 0
+
+
+# Whether imps can see a point, with rays cast through a grid of walls. Answers are cached per imp and kept while
+# neither the imp nor the point leaves its cell, so an imp standing still is not cast for again until the player
+# moves a cell. Imps are known by index, remove keeps the cache in step when imps go away.
+class LineOfSight:
+	def __init__(self, walls: SpatialGrid, cell_size: float = 0.5):
+		self.walls = walls
+		self.cell_size = cell_size
+		self.__target: tuple | None = None  # Cell the cached answers look at
+		self.__cells = np.zeros((0, 2), int)  # Cell of each imp when its answer was cached
+		self.__seen = np.zeros(0, bool)
+		self.__known = np.zeros(0, bool)
+		self.queries = 0  # Imps asked about and rays cast for them, since creation
+		self.rays = 0
+
+	def sees(self, index: int, point: Vec, target: Vec) -> bool:  # Whether imp index at point can see target
+		return bool(self.sees_batch(target, np.array([[*point]], np.float64), np.array([index]))[0])
+
+	def sees_batch(self, target: Vec, points: np.ndarray, indices: np.ndarray) -> np.ndarray:  # Mask of imps indices at (N, 3) points that see target
+		self.queries += len(indices)
+		if len(indices) and indices.max() >= len(self.__seen):  # Room for imps not asked about yet
+			grow = indices.max() + 1 - len(self.__seen)
+			self.__cells = np.concatenate((self.__cells, np.zeros((grow, 2), int)))
+			self.__seen = np.concatenate((self.__seen, np.zeros(grow, bool)))
+			self.__known = np.concatenate((self.__known, np.zeros(grow, bool)))
+		target_cell = (int(target.x // self.cell_size), int(target.z // self.cell_size))
+		if target_cell != self.__target:
+			self.__target = target_cell
+			self.__known[:] = False
+		cells = (points[:, [0, 2]] // self.cell_size).astype(int)
+		stale = ~self.__known[indices] | (cells != self.__cells[indices]).any(axis=1)
+
+		if stale.any():  # Imp sees target if the first wall along the way is beyond it
+			cast = indices[stale]
+			offsets = np.array([*target], np.float64) - points[stale]
+			distances = np.maximum(np.linalg.norm(offsets, axis=1), 1e-9)
+			walls, _ = self.walls.raycast_batch(points[stale], offsets / distances[:, None], float(distances.max()))
+			self.__seen[cast] = walls >= distances
+			self.__cells[cast] = cells[stale]
+			self.__known[cast] = True
+			self.rays += len(cast)
+		return self.__seen[indices]
+
+	def remove(self, indices):  # Forgets imps, later ones move down to close the gap like in EnemySwarm.remove
+		keep = np.ones(len(self.__seen), bool)
+		indices = np.atleast_1d(indices)
+		keep[indices[indices < len(keep)]] = False  # Imps never asked about have nothing cached
+		self.__cells, self.__seen, self.__known = self.__cells[keep], self.__seen[keep], self.__known[keep]
@@ -0,0 +1,47 @@
+# Enemy simulation step benchmark, run from repository root: python benchmarks/enemies.py
+# Imps are spread over an arena with pillars, the player stands in the middle so most of them chase at once.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Enemies import EnemySwarm
+from GameObject import Cube
+from Navigation import FlowField
+from Spatial import SpatialGrid
+from Vec import Vec
+
+
+def arena(size: float = 40, pillars: int = 8) -> list[Cube]:  # Outer walls and a grid of pillars, no GL needed
+	walls = [
+		Cube(None, None, Vec(0, 0.75, -size / 2), Vec(size, 1.5, 0.1)), Cube(None, None, Vec(0, 0.75, size / 2), Vec(size, 1.5, 0.1)),
+		Cube(None, None, Vec(-size / 2, 0.75, 0), Vec(0.1, 1.5, size)), Cube(None, None, Vec(size / 2, 0.75, 0), Vec(0.1, 1.5, size)),
+	]
+	for x in np.linspace(-size / 3, size / 3, pillars):
+		for z in np.linspace(-size / 3, size / 3, pillars):
+			walls.append(Cube(None, None, Vec(x, 0.75, z), Vec(1, 1.5, 1)))
+	return walls
+
+
+def main(number: int = 50):
+	walls = SpatialGrid(arena())
+	flow = FlowField(arena())
+	rng = np.random.default_rng(0)
+	print(f"{'imps':<8}{'step ms':>10}{'pairs':>8}{'flow ms':>10}")
+	for count in (17, 100, 500, 2000):
+		positions = [Vec(x, 0.367, z) for x, z in rng.uniform(-12, 12, (count, 2))]
+		eye = Vec(0, 0.5, 0.1)
+		times = []
+		for field in (None, flow):  # Straight at the player, then along the flow field
+			swarm = EnemySwarm(positions, Vec(1/2, 1.468/2, 1/2), walls, detection_radius=20, flow=field)
+			swarm.step(eye, 1 / 60)  # Warm up
+			times.append(timeit.timeit(lambda: swarm.step(eye, 1 / 60, True), number=number) / number * 1e3)
+		print(f"{count:<8}{times[0]:>10.3f}{swarm.pairs:>8}{times[1]:>10.3f}")
+
+
+if __name__ == "__main__":
+	main()
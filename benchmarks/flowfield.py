@@ -0,0 +1,63 @@
+# Flow field benchmark, run from repository root: python benchmarks/flowfield.py
+# The player walks across the enemies.py arena, the field is rebuilt from scratch or repaired after each one cell step.
+# Repaired fields are then checked against rebuilt ones along a walk hugging walls, where the player's cell is often blocked.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Navigation import FlowField
+from Vec import Vec
+
+from enemies import arena
+
+
+def main(number: int = 20):
+	field = FlowField(arena())
+	walk = [Vec(x, 0.5, 0.1) for x in np.arange(-4, 4, field.cell_size)]  # One cell per step
+	print(f"{'cells':<8}{'rebuild ms':>12}{'repair ms':>11}")
+
+	def rebuild():
+		for pos in walk:
+			field.forget()
+			field.update(pos)
+
+	def repair():
+		for pos in walk + walk[::-1]:
+			field.update(pos)
+
+	rebuild_time = timeit.timeit(rebuild, number=number) / number / len(walk) * 1e3
+	repair_time = timeit.timeit(repair, number=number) / number / (2 * len(walk)) * 1e3
+	print(f"{field.cells:<8}{rebuild_time:>12.3f}{repair_time:>11.3f}")
+
+	# Along the north outer wall, around a pillar and back, as close as the player can get
+	size, clearance = 40, 0.2 + 0.02
+	hug = [Vec(x, 0.5, -size / 2 + 0.05 + clearance) for x in np.arange(-6, 6, 0.13)]
+	pillar = -size / 3 + 0.5 + clearance
+	hug += [Vec(x, 0.5, pillar) for x in np.arange(-size / 3 - 2, -size / 3 + 2, 0.13)]
+	hug += [Vec(-size / 3 + 0.5 + clearance, 0.5, z) for z in np.arange(-size / 3 - 2, -size / 3 + 2, 0.13)]
+	rebuilt = FlowField(arena())
+	mismatches = blocked = 0
+	field.forget()
+	for pos in hug + hug[::-1]:
+		blocked += bool(field.blocked.reshape(-1)[field.cell(pos)])
+		field.update(pos)
+		rebuilt.forget()
+		rebuilt.update(pos)
+		mismatches += not (np.array_equal(field.distances, rebuilt.distances) and np.allclose(field.directions, rebuilt.directions))
+	print(f"repaired vs rebuilt: {mismatches} of {2 * len(hug)} fields differ, {blocked} steps in blocked cells")
+
+	rng = np.random.default_rng(0)
+	print(f"{'imps':<8}{'sample us':>12}")
+	for count in (17, 500, 2000):
+		points = rng.uniform(-12, 12, (count, 3))
+		t = timeit.timeit(lambda: field.sample(points), number=number * 10) / (number * 10) * 1e6
+		print(f"{count:<8}{t:>12.1f}")
+
+
+if __name__ == "__main__":
+	main()
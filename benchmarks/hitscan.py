@@ -0,0 +1,36 @@
+# Hitscan benchmark, run from repository root: python benchmarks/hitscan.py
+# Rays are cast from the middle of the enemies.py arena in random directions, against its walls and imps.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Enemies import EnemySwarm
+from Spatial import SpatialGrid
+from Vec import Vec
+
+from enemies import arena
+
+
+def main(number: int = 200):
+	walls = SpatialGrid(arena())
+	rng = np.random.default_rng(0)
+	eye = Vec(0, 0.5, 0.1)
+	print(f"{'imps':<8}{'rays':>6}{'us per call':>13}{'us per ray':>12}")
+	for count in (17, 500):
+		swarm = EnemySwarm([Vec(x, 0.367, z) for x, z in rng.uniform(-12, 12, (count, 2))], Vec(1/2, 1.468/2, 1/2), walls)
+		t = timeit.timeit(lambda: swarm.raycast(eye, Vec(0, 0, -1), 20), number=number) / number * 1e6
+		print(f"{count:<8}{1:>6}{t:>13.1f}{t:>12.1f}")
+		for rays in (10, 100, 1000):
+			directions = rng.normal(size=(rays, 3)) * (1, 0.05, 1)  # Mostly level, like shotgun pellets
+			origins = np.tile([*eye], (rays, 1))
+			t = timeit.timeit(lambda: swarm.raycast_batch(origins, directions, 20), number=max(1, number // rays)) / max(1, number // rays) * 1e6
+			print(f"{count:<8}{rays:>6}{t:>13.1f}{t / rays:>12.1f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,59 @@
+# Micro-benchmarks for model matrix composition, run from repository root: python benchmarks/matrix.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Matrix import ModelMatrix, compose_batch
+from Vec import Vec
+
+
+def chain(model: ModelMatrix, pos: Vec, rotation: Vec, scale: Vec, orientation):  # What Coord.apply used to do
+	model.load_identity()
+	model.translate(pos)
+	if orientation is not None:
+		model.transform(orientation)
+	model.rotate(rotation)
+	model.scale(scale)
+	return model.matrix
+
+
+def main(number: int = 20000):
+	model = ModelMatrix()
+	out = np.empty((4, 4), np.float64)
+	pos, rotation, scale = Vec(1.5, -2, 3.25), Vec(0.3, -1.2, 2.1), Vec(0.5, 1.468, 2)
+	orientation = [
+		0.6, 0.0, -0.8, 0.0,
+		0.0, 1.0, 0.0, 0.0,
+		0.8, 0.0, 0.6, 0.0,
+		0.0, 0.0, 0.0, 1.0
+	]
+
+	for ori in (None, orientation):
+		assert np.allclose(chain(model, pos, rotation, scale, ori), ModelMatrix.compose(pos, rotation, scale, ori, out))
+
+	print(f"{'case':<28}{'chain us':>10}{'compose us':>12}{'speedup':>9}")
+	for name, ori in (("translate rotate scale", None), ("with orientation", orientation)):
+		t_chain = timeit.timeit(lambda: chain(model, pos, rotation, scale, ori), number=number) / number * 1e6
+		t_compose = timeit.timeit(lambda: ModelMatrix.compose(pos, rotation, scale, ori, out), number=number) / number * 1e6
+		print(f"{name:<28}{t_chain:>10.2f}{t_compose:>12.2f}{t_chain / t_compose:>8.1f}x")
+
+	print(f"\n{'objects':<28}{'compose ms':>10}{'batch ms':>12}{'speedup':>9}")
+	rng = np.random.default_rng(0)
+	for count in (100, 1000, 5000):
+		positions, rotations, scales = rng.normal(size=(3, count, 3))
+		vecs = [(Vec(*p), Vec(*r), Vec(*s)) for p, r, s in zip(positions, rotations, scales)]
+		assert np.allclose(compose_batch(positions, rotations, scales)[-1], ModelMatrix.compose(*vecs[-1]), atol=1e-4)
+		out = np.empty((count, 4, 4), np.float32)
+		repeat = max(1, number // count)
+		t_compose = timeit.timeit(lambda: [ModelMatrix.compose(*v, out=out[0]) for v in vecs], number=repeat) / repeat * 1e3
+		t_batch = timeit.timeit(lambda: compose_batch(positions, rotations, scales, out=out), number=repeat) / repeat * 1e3
+		print(f"{count:<28}{t_compose:>10.3f}{t_batch:>12.3f}{t_compose / t_batch:>8.1f}x")
+
+
+if __name__ == "__main__":
+	main()
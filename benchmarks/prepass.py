@@ -0,0 +1,90 @@
+# Depth pre-pass benchmark on a fragment heavy scene, run from repository root: python benchmarks/prepass.py
+# Layers covering the whole view are lit by every light, so nearly all time is spent shading fragments.
+# Needs a GL context, without a display run with SDL_VIDEODRIVER=offscreen PYOPENGL_PLATFORM=egl
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame as pg
+from pygame.locals import *
+
+from OpenGL.GL import *
+
+from Camera import Camera
+from GameObject import Cube
+from Lighting import Light, LightManager, Material
+from Matrix import ModelMatrix
+from RenderQueue import RenderQueue
+from Shader import Shader3D
+from Vec import Vec
+
+
+# Layer i is 1 + i / 2 units in front of the camera. Materials sort before depth in the queue, so they are picked
+# to draw the layers back to front, the worst case for overdraw, or front to back, the best case.
+def scene(model: ModelMatrix, shader: Shader3D, layers: int, back_to_front: bool) -> list[Cube]:
+	return [
+		Cube(model, shader, pos=Vec(0, 0, -1 - i / 2), scale=Vec(2 + i, 2 + i, 0.01), material=Material(
+			Vec.all(0.2 + 0.5 * ((layers - i) if back_to_front else i) / layers), Vec(0.3), Vec(0.05)
+		))
+		for i in range(layers)
+	]
+
+
+def render(queue: RenderQueue, camera: Camera, objects: list[Cube], texture: int):
+	glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+	queue.begin(camera.view.eye, camera.update_frustum())
+	for ob in objects:
+		queue.submit(ob, texture)
+	queue.flush()
+
+
+def main(width: int = 1280, height: int = 720, layers: int = 12, frames: int = 10):
+	pg.display.init()
+	pg.display.set_mode((width, height), DOUBLEBUF | OPENGL)
+	glEnable(GL_DEPTH_TEST)
+	glViewport(0, 0, width, height)
+
+	shader = Shader3D()
+	shader.use()
+	model = ModelMatrix()
+	camera = Camera(shader)
+	camera.set_perspective(45, width / height, 0.142, 100)
+	camera.pos = Vec(0, 0, 0)
+	camera.look(Vec(0, 0, -1))
+
+	lights = LightManager(shader.light_capacity)
+	for ind in range(shader.light_capacity):
+		lights.set_light(Light(Vec(0.1), Vec(0.1), Vec(0.01), Vec(ind - 3.5, (ind % 3) - 1, -0.5)), ind)
+	lights.flush()
+	shader.lights = lights
+
+	texture = glGenTextures(1)  # Plain white, only the lighting is measured
+	glBindTexture(GL_TEXTURE_2D, texture)
+	glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+	glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_UNSIGNED_BYTE, bytes([255] * 4))
+
+	print(f"{layers} layers at {width}x{height}, {shader.light_capacity} lights, renderer: {glGetString(GL_RENDERER).decode()}")
+	print(f"{'order':<16}{'no pre-pass ms':>16}{'pre-pass ms':>13}{'speedup':>9}")
+	for back_to_front in (True, False):
+		objects = scene(model, shader, layers, back_to_front)
+		times = []
+		for depth_prepass in (False, True):
+			queue = RenderQueue(depth_prepass)
+			render(queue, camera, objects, texture)  # Warm up, first frame compiles and uploads
+			glFinish()
+			start = time.perf_counter()
+			for _ in range(frames):
+				render(queue, camera, objects, texture)
+				glFinish()
+			times.append((time.perf_counter() - start) / frames * 1e3)
+		order = "back to front" if back_to_front else "front to back"
+		print(f"{order:<16}{times[0]:>16.2f}{times[1]:>13.2f}{times[0] / times[1]:>8.2f}x")
+
+	pg.quit()
+
+
+if __name__ == "__main__":
+	main()
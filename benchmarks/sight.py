@@ -0,0 +1,44 @@
+# Line of sight benchmark, run from repository root: python benchmarks/sight.py
+# The player walks slowly across the enemies.py arena while every imp asks whether it can see them each frame.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Spatial import SpatialGrid
+from Vec import Vec
+from Visibility import LineOfSight
+
+from enemies import arena
+
+
+def main(frames: int = 120):
+	walls = SpatialGrid(arena())
+	rng = np.random.default_rng(0)
+	path = [Vec(-2 + 4 * i / frames, 0.5, 0.1) for i in range(frames)]  # About 4 m/s at 60 fps
+	print(f"{'imps':<8}{'cached ms':>11}{'rays':>8}{'uncached ms':>13}{'rays':>8}")
+	for count in (17, 500, 2000):
+		points = np.c_[rng.uniform(-12, 12, count), np.full(count, 0.5), rng.uniform(-12, 12, count)]
+		indices = np.arange(count)
+
+		sight = LineOfSight(walls)
+		start = time.perf_counter()
+		for eye in path:
+			sight.sees_batch(eye, points, indices)
+		cached = (time.perf_counter() - start) / frames * 1e3
+
+		start = time.perf_counter()
+		for eye in path:  # Every imp cast for every frame
+			offsets = np.array([*eye]) - points
+			distances = np.linalg.norm(offsets, axis=1)
+			walls.raycast_batch(points, offsets / distances[:, None], float(distances.max()))
+		uncached = (time.perf_counter() - start) / frames * 1e3
+		print(f"{count:<8}{cached:>11.3f}{sight.rays // frames:>8}{uncached:>13.3f}{count:>8}")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,5 +1,3 @@
-import math
-
 from Vec import Vec
 
 
@@ -33,18 +31,3 @@ def lerpr(x, in_min, in_max, out_min, out_max): # Maps a from given input interv
 
 def project(p, l):  # Projects point p onto line l
 	return l * (p.dot(l) / l.dot(l))
-
-
-def in_range(p, l1, l2):  # Checks if point p is in range l1, l2
-	if not math.isclose(l1.x, l2.x):
-		return l1.x >= p.x >= l2.x or l1.x <= p.x <= l2.x
-	return l1.y >= p.y >= l2.y or l1.y <= p.y <= l2.y
-
-
-def ray(vec_pos: Vec, vec: Vec, line_pos: Vec, line: Vec, line2: Vec) -> bool:  # Probably doesn't work
-	perp_line = line.cross(line2)
-	if (perp_dot_vec := perp_line.dot(vec)) != 0:
-		hit_time = perp_line.dot(line_pos - vec_pos) / perp_dot_vec
-		hit_point = vec_pos + vec * hit_time
-		print(hit_time)
-		return in_range(hit_point, line_pos, line_pos + line)
@@ -4,9 +4,9 @@ from Shader import Shader3D
 
 from Matrix import ModelMatrix
 
-from Lighting import Light, Material
+from Lighting import Light, LightManager, Material
 
-from GameObject import Cube, Sprite, Mesh
+from GameObject import Cube, Sprite, Mesh, StaticBatch, SpriteBatch
 
 from Vec import Vec
 
@@ -20,20 +20,35 @@ from Camera import Camera
 
 from Timer import Timer
 
+from Texture import TextureAtlas
+
+from Visibility import LineOfSight, VisibilityGrid
+
+from Spatial import SpatialGrid
+
+from Enemies import EnemySwarm
+
+from Navigation import FlowField
+
+from RenderQueue import RenderQueue
+
+from Text import TextLabel, TextRenderer
+
 from random import choice
 
+import sys
+
 
 class GameHandler(GenericGameHandler):
-	def __init__(self, x_bounds, y_bounds, desired_fps, bg_color=(0.2, 0.2, 0.2, 1.0)):
-		super().__init__(x_bounds, y_bounds, desired_fps, bg_color)
+	def __init__(self, x_bounds, y_bounds, desired_fps, bg_color=(0.2, 0.2, 0.2, 1.0), rebake=False, depth_prepass=False,
+				 dynamic_resolution=False):
+		super().__init__(x_bounds, y_bounds, desired_fps, bg_color, depth_prepass, dynamic_resolution)
 
 		# GAME LOGIC VARIABLES
 		self.muzzle_timer = Timer(0)
 		self.muzzle_time = 75
 		self.shot = False
 
-		self.hit_margin = 0.1  # How accurate you have to be to hit shots, lower = more accurate
-
 		self.mov_spd = 4
 		self.rot_spd = 3.5
 		self.mov_vec = Vec.zero()
@@ -79,9 +94,12 @@ class GameHandler(GenericGameHandler):
 			Light(Vec(0.35), Vec(), Vec.zero(), Vec(-14.5, 0.5, -6)),
 		)
 
-		# Pass lights to shader
+		# Pass lights to shader through the light uniform buffer, they never change so they're baked into level geometry
+		self.light_manager = LightManager(self.shader.light_capacity)
 		for ind, light in enumerate(self.lights):
-			self.shader.set_light(*light, ind)
+			self.light_manager.set_light(light, ind, static=True)
+		bake = {"lights": self.lights, "rebake": rebake}  # See StaticBatch
+		self.shader.lights = self.light_manager  # Shader picks lights per object from these
 
 		self.gun_flash = Light(Vec(), Vec(), Vec())  # Light which follows the gun and is only active when firing
 
@@ -93,28 +111,26 @@ class GameHandler(GenericGameHandler):
 		self.floor = Cube(self.model, self.shader, Vec(5, -0.05, 5), Vec(100, 0.1, 100), material=floor_mat, tiling=(32, 32))
 		self.ceiling = Cube(self.model, self.shader, Vec(5, 1.55, 5), Vec(100, 0.1, 100), material=ceiling_mat, tiling=(16, 16))
 
-		self.enemies = [
-			Sprite(self.model, self.shader, Vec(-4.5, 1.468/4, 3.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(7, 1.468/4, 8), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(3, 1.468/4, 3.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(19.5, 1.468/4, 9.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(18, 1.468/4, -11.75), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(15.25, 1.468/4, -23.75), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(26.75, 1.468/4, -21.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(21, 1.468/4, -23.75), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-7.75, 1.468/4, 2.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-10, 1.468/4, 4.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-20.5, 1.468/4, 4), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-20.5, 1.468/4, -11), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-11, 1.468/4, -11.5), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-8.5, 1.468/4, -9), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-11, 1.468/4, -9.25), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-16.5, 1.468/4, -3.25), Vec(1/2, 1.468/2, 1/2)),
-			Sprite(self.model, self.shader, Vec(-18.25, 1.468/4, -0.25), Vec(1/2, 1.468/2, 1/2)),
+		self.enemy_positions = [  # Simulated together once the walls are known, see self.enemies
+			Vec(-4.5, 1.468/4, 3.5),
+			Vec(7, 1.468/4, 8),
+			Vec(3, 1.468/4, 3.5),
+			Vec(19.5, 1.468/4, 9.5),
+			Vec(18, 1.468/4, -11.75),
+			Vec(15.25, 1.468/4, -23.75),
+			Vec(26.75, 1.468/4, -21.5),
+			Vec(21, 1.468/4, -23.75),
+			Vec(-7.75, 1.468/4, 2.5),
+			Vec(-10, 1.468/4, 4.5),
+			Vec(-20.5, 1.468/4, 4),
+			Vec(-20.5, 1.468/4, -11),
+			Vec(-11, 1.468/4, -11.5),
+			Vec(-8.5, 1.468/4, -9),
+			Vec(-11, 1.468/4, -9.25),
+			Vec(-16.5, 1.468/4, -3.25),
+			Vec(-18.25, 1.468/4, -0.25),
 		]
 
-		self.enemy_states = ["idle"] * len(self.enemies)
-
 		self.walls = [
 			Cube(self.model, self.shader, Vec(3, 1.5/2, 12), Vec(32*1.5, 1.5, 0.1), tiling=(32,1)),
 			Cube(self.model, self.shader, Vec(18*1.5, 1.5/2, 12-24*1.5/2), Vec(0.1, 1.5, 24*1.5), tiling=(24,1)),
@@ -142,23 +158,43 @@ class GameHandler(GenericGameHandler):
 			Cube(self.model, self.shader, Vec(3.75, 1.5 / 2, -3), Vec(15.0625 * 1.5, 1.5, 0.1), tiling=(15.0625, 1)),
 		]
 
+		self.wall_batch = StaticBatch(self.model, self.shader, self.walls, **bake)  # Walls never move so they're drawn as one mesh
+
+		# Cells of the floor plan seen from each other, whatever is in cells hidden from the player isn't drawn or simulated
+		self.visibility = VisibilityGrid(self.walls, far=self.camera.fog_end, rebuild=rebake)
+		self.camera.frustum.visibility = self.visibility
+
+		self.wall_grid = SpatialGrid(self.walls)  # Movers only collide with walls near them
+
+		self.flow_field = FlowField(self.walls, clearance=self.radius)  # Ways around walls to the player, shared by every imp
+		self.line_of_sight = LineOfSight(self.wall_grid)  # Imps only wake up when they can see the player
+
+		self.enemies = EnemySwarm(
+			self.enemy_positions, Vec(1/2, 1.468/2, 1/2), self.wall_grid, self.visibility,
+			self.radius, self.enemy_speed, self.enemy_detection_radius, self.flow_field, self.line_of_sight
+		)
+
 		self.keycards = {
-			"red": Sprite(self.model, self.shader, Vec(26, 0.2 / 2, -23), Vec.all(0.2)),
-			"blue": Sprite(self.model, self.shader, Vec(-8, 0.2 / 2, 4.5), Vec.all(0.2)),
-			"yellow": Sprite(self.model, self.shader, Vec(-8, 0.2 / 2, -11.5), Vec.all(0.2)),
+			"red": Sprite(self.model, self.shader, Vec(26, 0.2 / 2, -23), Vec.all(0.2), frame="red"),
+			"blue": Sprite(self.model, self.shader, Vec(-8, 0.2 / 2, 4.5), Vec.all(0.2), frame="blue"),
+			"yellow": Sprite(self.model, self.shader, Vec(-8, 0.2 / 2, -11.5), Vec.all(0.2), frame="yellow"),
 		}
 
 		self.ammoboxes = [
-			Sprite(self.model, self.shader, Vec(26, 0.1, -11), Vec(0.2 * 1.75, 0.2, 0.2)),
-			Sprite(self.model, self.shader, Vec(18, 0.1, -7), Vec(0.2 * 1.75, 0.2, 0.2)),
+			Sprite(self.model, self.shader, Vec(26, 0.1, -11), Vec(0.2 * 1.75, 0.2, 0.2), frame="ammo"),
+			Sprite(self.model, self.shader, Vec(18, 0.1, -7), Vec(0.2 * 1.75, 0.2, 0.2), frame="ammo"),
 		]
 
 		self.medkits = [
-			Sprite(self.model, self.shader, Vec(18, 0.1, -11), Vec(0.2 * 2.315, 0.2, 0.2))
+			Sprite(self.model, self.shader, Vec(18, 0.1, -11), Vec(0.2 * 2.315, 0.2, 0.2), frame="medkit")
 		]
 
 		self.door = Cube(self.model, self.shader, Vec(-20.9, 1.5 / 2, -1.25), Vec(0.1, 1.5, 1.5))
 
+		self.floor_batch = StaticBatch(self.model, self.shader, [self.floor], **bake)
+		self.ceiling_batch = StaticBatch(self.model, self.shader, [self.ceiling], **bake)
+		self.door_batch = StaticBatch(self.model, self.shader, [self.door], **bake)
+
 		self.gun = Sprite(self.model, self.shader, Vec(), Vec.all(0.2))
 
 		self.muzzle = Sprite(self.model, self.shader, Vec(), Vec.all(0.2))
@@ -173,22 +209,29 @@ class GameHandler(GenericGameHandler):
 		self.door_tex = self.load_texture("textures/DOOR3.png")
 		self.gun_tex = self.load_texture("textures/Pistol.png")
 		self.muzzle_tex = self.load_texture("textures/Muzzle.png")
-		self.ammobox_tex = self.load_texture("textures/ammo.png")
-		self.medkit_tex = self.load_texture("textures/medkit.png")
 
-		self.keycard_tex = {
-			"red": self.load_texture("textures/KeycardRed.png"),
-			"blue": self.load_texture("textures/KeycardBlue.png"),
-			"yellow": self.load_texture("textures/KeycardYellow.png")
-		}
-
-		self.enemy_state_tex = {
-			"idle": self.load_texture("textures/impidle.png"),
-			"walk0": self.load_texture("textures/impwalk0.png"),
-			"walk1": self.load_texture("textures/impwalk1.png"),
-			"walk2": self.load_texture("textures/impwalk2.png"),
-			"attack": self.load_texture("textures/impattack.png"),
-		}
+		# Imp animation frames (named after enemy states) and pickups share one texture, selected by sprite frame
+		self.sprite_atlas = TextureAtlas({
+			"idle": "textures/impidle.png",
+			"walk0": "textures/impwalk0.png",
+			"walk1": "textures/impwalk1.png",
+			"walk2": "textures/impwalk2.png",
+			"attack": "textures/impattack.png",
+			"red": "textures/KeycardRed.png",
+			"blue": "textures/KeycardBlue.png",
+			"yellow": "textures/KeycardYellow.png",
+			"ammo": "textures/ammo.png",
+			"medkit": "textures/medkit.png",
+		})
+
+		# Every enemy and pickup is drawn with one instanced call. Each sprite picks its own lights, all that reach it
+		# as lights have no falloff, setting max_lights would drop the furthest and visibly change their colour
+		self.sprite_batch = SpriteBatch(self.model, self.shader, self.sprite_atlas.rects)
+
+		self.enemy_frames = self.sprite_batch.frame_indices(EnemySwarm.FRAMES)
+
+		self.render_queue = RenderQueue(self.depth_prepass)
+		self.text_renderer = TextRenderer(self.bounds, self.shader)
 
 		# MUSIC & SFX
 		pg.mixer.music.load("sounds/doomE1M1.wav")
@@ -225,12 +268,11 @@ class GameHandler(GenericGameHandler):
 		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, tex_string)
 		return tex_id
 
-	def render_text(self, text: str, position: Vec, color: Vec, size: int, font_file: str = "fonts/DoomLeft.ttf"):
-		font = pg.font.Font(font_file, size)
-		text_surface = font.render(text, True, (*color,))
-		text_data = pg.image.tostring(text_surface, "RGBA", True)
-		glWindowPos2i(position.x, position.y)
-		glDrawPixels(text_surface.get_width(), text_surface.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, text_data)
+	# Label showing text at position, labels are kept between frames and only rebuilt when their text changes
+	def text_label(self, text: str, position: Vec, color: Vec, size: int, font_file: str = "fonts/DoomLeft.ttf") -> TextLabel:
+		label = self.text_renderer.label(position, color, size, font_file)
+		label.set_text(text)
+		return label
 
 	def collide_objects(self, old_pos, new_pos, pos, objects):
 		for ob in objects:
@@ -265,7 +307,8 @@ class GameHandler(GenericGameHandler):
 		self.camera.slide(self.mov_vec * self.mov_spd * self.delta_time)
 		new_pos = self.camera.view.eye
 
-		self.collide_objects(old_pos, new_pos, self.camera.pos, self.walls)  # Collide player with textures
+		# Collide player with textures
+		self.collide_objects(old_pos, new_pos, self.camera.pos, self.wall_grid.query(old_pos, new_pos, self.radius))
 
 		# Gun is a little in front of and below camera
 		self.gun.coord.pos = self.camera.pos - self.camera.view.n * 0.5 - self.camera.view.v * 0.175
@@ -277,39 +320,19 @@ class GameHandler(GenericGameHandler):
 		self.muzzle.coord.look(self.camera.pos)  # Muzzle sprite is looking at player
 		self.gun_flash.pos = self.camera.pos - self.camera.view.n * 0.1  # Gun flash-light follows the gun
 
-		hit = False
-		for x, enemy in enumerate(self.enemies):
-			dist = enemy.coord.pos.dist(self.camera.pos)  # Distance from enemy to camera (player)
-			if dist <= 4 * self.radius:  # Within attack range
-				self.enemy_states[x] = "attack"
-				if self.hp_drain_timer.passed():  # Only take damage if enough time has passed since last damage taken
-					self.hp -= 5
-					self.oof_sfx.play()
-					hit = True
-			elif dist <= self.enemy_detection_radius:  # Player is close enough to enemy to be detected
-				direction = self.camera.pos - enemy.coord.pos  # Direction to player
-				old_pos = enemy.coord.pos
-				enemy.coord.pos += direction * self.enemy_speed * self.delta_time  # Move towards player
-				new_pos = enemy.coord.pos
-				# Enemy collides with all other enemies and textures
-				self.collide_objects(old_pos, new_pos, enemy.coord.pos, self.enemies[:x] + self.enemies[x+1:] + self.walls)
-				if self.enemy_state_update_timer.passed():  # Ensures animation frames don't change each game frame
-					if self.enemy_states[x].startswith("walk"):  # Next frame in walk cycle
-						self.enemy_states[x] = f"walk{(int(self.enemy_states[x][-1])+1)%3}"
-					else:  # First frame in walk cycle
-						self.enemy_states[x] = "walk0"
-			else:
-				self.enemy_states[x] = "idle"
-
-			n, _, _ = enemy.coord.look(self.camera.pos)  # Enemy looks at player, we store forward direction for enemy
-			# If the player has shot last frame, enemy is within range, and forward vectors of player and enemy are
-			# near opposites, then the player has hit.
-			if self.shot and dist <= 2 * self.enemy_detection_radius and pi - self.camera.view.n.angle(n) < self.hit_margin:
+		# Enemies chase the player when they see them and attack when close enough
+		attackers = self.enemies.step(self.camera.pos, self.delta_time, self.enemy_state_update_timer.passed())
+		if attackers and self.hp_drain_timer.passed():  # Only take damage if enough time has passed since last damage taken
+			self.hp -= 5 * attackers
+			self.oof_sfx.play()
+			self.hp_drain_timer.start(self.hp_drain_time)  # Damage immunity
+
+		# If the player has shot last frame, the first enemy in the line of fire is hit, unless a wall is in the way
+		if self.shot:
+			_, enemy = self.enemies.raycast(self.camera.pos, -self.camera.view.n, 2 * self.enemy_detection_radius)
+			if enemy >= 0:
 				choice((self.death1_sfx, self.death2_sfx)).play()  # Random death sound for enemy
-				del self.enemies[x]  # Delete enemy
-
-		if hit:  # If the player was hit this frame, start damage immunity timer
-			self.hp_drain_timer.start(self.hp_drain_time)
+				self.enemies.remove(enemy)  # Delete enemy
 
 		if self.enemy_state_update_timer.passed():  # Reset animation delay timer
 			self.enemy_state_update_timer.reset()
@@ -318,12 +341,12 @@ class GameHandler(GenericGameHandler):
 			self.clip -= 1
 			self.gun_flash.diff = Vec(0.75, 0.25)
 			self.gun_flash.spec = Vec(0.2, 0.1, 0.1)
-			self.shader.set_light(*self.gun_flash, len(self.lights))
+			self.light_manager.set_light(self.gun_flash, len(self.lights))
 			self.shot = False
 		elif self.muzzle_timer.passed() and self.gun_flash.diff.x != 0:
 			self.gun_flash.diff = Vec()
 			self.gun_flash.spec = Vec()
-			self.shader.set_light(*self.gun_flash, len(self.lights))
+			self.light_manager.set_light(self.gun_flash, len(self.lights))
 
 		for key, card in [*self.keycards.items()]:  # Key-card pickup
 			card.coord.look(self.camera.pos)  # Card sprite is looking at camera
@@ -369,54 +392,44 @@ It took you {pg.time.get_ticks()/1000} seconds.""")
 
 	def display(self):
 		self.model.load_identity()  # Reset model matrix
+		self.light_manager.flush()  # Upload lights changed since last frame
+		frustum = self.camera.update_frustum()  # Objects out of view or fully fogged are skipped
 
-		glBindTexture(GL_TEXTURE_2D, self.ceiling_tex)
-		self.doom_logo.draw()
-
-		glBindTexture(GL_TEXTURE_2D, self.wall_tex)
-		for wall in self.walls:
-			wall.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.floor_tex)
-		self.floor.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.door_tex)
-		self.door.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.ceiling_tex)
-		self.ceiling.draw_set()
-
-		for key, card in self.keycards.items():
-			glBindTexture(GL_TEXTURE_2D, self.keycard_tex[key])
-			card.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.ammobox_tex)
-		for ammobox in self.ammoboxes:
-			ammobox.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.medkit_tex)
-		for medkit in self.medkits:
-			medkit.draw_set()
-
-		for x, enemy in enumerate(self.enemies):
-			glBindTexture(GL_TEXTURE_2D, self.enemy_state_tex[self.enemy_states[x]])
-			enemy.draw_set()
-
-		glClear(GL_DEPTH_BUFFER_BIT)  # Clear depth buffer so that following objects render on top
+		self.sprite_batch.submit(
+			[*self.keycards.values(), *self.ammoboxes, *self.medkits], self.camera.view.eye, frustum,
+			self.enemies.instances(self.enemy_frames)
+		)
 
+		# Queue sorts draws to save on state changes, see self.render_queue.frame_stats
+		self.render_queue.begin(self.camera.view.eye, frustum)
+		self.render_queue.submit(self.doom_logo, self.ceiling_tex)
+		self.render_queue.submit(self.wall_batch, self.wall_tex)
+		self.render_queue.submit(self.floor_batch, self.floor_tex)
+		self.render_queue.submit(self.door_batch, self.door_tex)
+		self.render_queue.submit(self.ceiling_batch, self.ceiling_tex)
+		self.render_queue.submit(self.sprite_batch, self.sprite_atlas.tex_id, RenderQueue.TRANSPARENT)
+		self.render_queue.flush()
+
+	def display_hud(self):
+		# Gun and muzzle render on top of everything else
+		self.render_queue.begin(self.camera.view.eye)
 		if not self.muzzle_timer.passed():
-			glBindTexture(GL_TEXTURE_2D, self.muzzle_tex)
-			self.muzzle.draw_set()
-
-		glBindTexture(GL_TEXTURE_2D, self.gun_tex)
-		self.gun.draw_set()
-
-		self.render_text(f"{self.clip}/{self.ammo}", Vec(15, 90), Vec(255), 48)
-		self.render_text(str(self.hp), Vec(15, 0), Vec(255), 96)
-		self.render_text(
-			f"R: {int('red'not in self.keycards)}  B: {int('blue'not in self.keycards)}  Y: {int('yellow'not in self.keycards)}",
-			Vec(self.bounds.x-175, 0), Vec(255), 48, "fonts/DoomRight.ttf"
-		)
+			self.render_queue.submit(self.muzzle, self.muzzle_tex, RenderQueue.OVERLAY)
+		self.render_queue.submit(self.gun, self.gun_tex, RenderQueue.OVERLAY)
+		self.render_queue.flush()
+
+		self.text_renderer.draw([
+			self.text_label(f"{self.clip}/{self.ammo}", Vec(15, 90), Vec(255), 48),
+			self.text_label(str(self.hp), Vec(15, 0), Vec(255), 96),
+			self.text_label(
+				f"R: {int('red'not in self.keycards)}  B: {int('blue'not in self.keycards)}  Y: {int('yellow'not in self.keycards)}",
+				Vec(self.bounds.x-175, 0), Vec(255), 48, "fonts/DoomRight.ttf"
+			),
+		])
+
+		self.shader.end_frame()  # Uniform update counters are per frame, see self.shader.frame_stats
+		self.camera.frustum.end_frame()  # As are culled and drawn counts, see self.camera.frustum.frame_stats
+		self.render_queue.end_frame()
 
 	def update_input(self):
 		for event in pg.event.get():
@@ -473,5 +486,8 @@ It took you {pg.time.get_ticks()/1000} seconds.""")
 					self.mov_vec.z += 1
 
 
-gh = GameHandler(1280, 720, 60)
+gh = GameHandler(
+	1280, 720, 60,
+	rebake="--rebake" in sys.argv, depth_prepass="--prepass" in sys.argv, dynamic_resolution="--dynres" in sys.argv
+)
 gh.loop()
\ No newline at end of file
@@ -1,7 +1,10 @@
+#version 140
+
 struct Light {
 	vec4 diffuse;
 	vec4 specular;
 	vec4 ambience;
+	vec4 position;
 };
 
 struct Material {
@@ -11,33 +14,55 @@ struct Material {
 	vec4 ambience;
 };
 
+layout(std140) uniform Lights {  // Filled by LightManager
+	vec4 ambience;  // Sum of every light's ambience, so it doesn't depend on which lights are selected
+	Light light[LIGHT_CAPACITY];
+};
+
+uniform int u_lights[MAX_LIGHTS];  // Indices of lights selected for this draw, -1 after the last one
+uniform bool u_instanced;  // Lights are selected per instance instead, in v_instance_lights
+uniform bool u_baked;  // Diffuse light of static lights comes from v_baked
+
 uniform sampler2D u_tex01;
 
-uniform Light light[8];
 uniform Material material;
 
 uniform float u_fog_start;
 uniform float u_fog_end;
 uniform vec4 u_fog_color;
 
-varying vec4 normal;
-varying vec4 s[8];
-varying vec4 h[8];
-varying vec4 v;
-varying vec2 v_uv;
+in vec4 normal;
+in vec4 position;
+in vec4 v;
+in vec2 v_uv;
+in vec3 v_baked;
+flat in ivec4 v_instance_lights[2];
+
+out vec4 frag_color;
 
 void main(void)
 {
-    vec4 tex_col = texture2D(u_tex01, v_uv);
+#ifdef DEPTH_ONLY
+	frag_color = vec4(0.0);  // Colour writes are off in the depth pre-pass
+#else
+	vec4 tex_col = texture(u_tex01, v_uv);
 	vec4 mat_amb = material.ambience * tex_col;
 	vec4 mat_diff = material.diffuse * tex_col;
-	vec4 color = vec4(0.0);
-	for(int i = 0; i < 8; i++) {
-		float lambert = max(0, dot(normal, s[i])/(length(normal) * length(s[i]))) * max(1, 2/length(s[i]));
-		float phong = max(0, dot(h[i], normal)/(length(normal) * length(h[i])));
-		color += lambert * light[i].diffuse * mat_diff + pow(phong, material.shininess) * light[i].specular * material.specular + light[i].ambience * mat_amb;
+	vec4 color = ambience * mat_amb;
+	if(u_baked) color += vec4(v_baked, 0.0) * mat_diff;
+	for(int i = 0; i < MAX_LIGHTS; i++) {
+		int index = u_lights[i];
+		if(u_instanced) index = i < 8 ? v_instance_lights[i / 4][i % 4] : -1;
+		if(index < 0) break;
+		Light l = light[index];
+		vec4 s = l.position - position;
+		vec4 h = s + v;
+		float lambert = max(0.0, dot(normal, s)/(length(normal) * length(s))) * max(1.0, 2.0/length(s));
+		float phong = max(0.0, dot(h, normal)/(length(normal) * length(h)));
+		color += lambert * l.diffuse * mat_diff + pow(phong, material.shininess) * l.specular * material.specular;
 	}
 
-	gl_FragColor = mix(color, u_fog_color, clamp((length(v) - u_fog_start)/(u_fog_end - u_fog_start), 0, 1));
-	gl_FragColor.a = mat_amb.a;
-}
\ No newline at end of file
+	frag_color = mix(color, u_fog_color, clamp((length(v) - u_fog_start)/(u_fog_end - u_fog_start), 0.0, 1.0));
+	frag_color.a = mat_amb.a;
+#endif
+}
@@ -1,30 +1,51 @@
-attribute vec3 a_position;
-attribute vec3 a_normal;
-attribute vec2 a_uv;
+#version 140
+
+in vec3 a_position;
+in vec3 a_normal;
+in vec2 a_uv;
+in mat4 a_instance_matrix;
+in float a_instance_frame;
+in vec3 a_baked;
+in mat2x4 a_instance_lights;
 
-uniform vec4 u_light_position[8];
 uniform vec4 u_camera_position;
 uniform mat4 u_model_matrix;
 uniform mat4 u_projection_matrix;
 uniform mat4 u_view_matrix;
+uniform vec2 u_uv_scale;
+uniform vec4 u_uv_rect;
+uniform bool u_instanced;
+uniform vec4 u_frame_rects[16];
+
+out vec4 normal;
+out vec4 position;
+out vec4 v;
+out vec2 v_uv;
+out vec3 v_baked;
+flat out ivec4 v_instance_lights[2];
 
-varying vec4 normal;
-varying vec4 s[8];
-varying vec4 h[8];
-varying vec4 v;
-varying vec2 v_uv;
+invariant gl_Position;  // Depth pre-pass and lit pass must produce equal depths
 
 void main(void)
 {
-    v_uv = a_uv;
-	vec4 position = u_model_matrix * vec4(a_position.x, a_position.y, a_position.z, 1);
-	normal = u_model_matrix * vec4(a_normal.x, a_normal.y, a_normal.z, 0);
+	mat4 model_matrix = u_model_matrix;
+	vec4 rect = u_uv_rect;  // xy offset, zw scale
+	if(u_instanced) {
+		model_matrix = u_model_matrix * a_instance_matrix;
+		rect = u_frame_rects[int(a_instance_frame)];
+		v_instance_lights[0] = ivec4(a_instance_lights[0]);
+		v_instance_lights[1] = ivec4(a_instance_lights[1]);
+	}
+	else {
+		v_instance_lights[0] = v_instance_lights[1] = ivec4(-1);
+	}
+	v_uv = a_uv * u_uv_scale * rect.zw + rect.xy;
+	v_baked = a_baked;
+
+	position = model_matrix * vec4(a_position.x, a_position.y, a_position.z, 1);
+	normal = model_matrix * vec4(a_normal.x, a_normal.y, a_normal.z, 0);
 
 	v = u_camera_position - position;
-	for(int i = 0; i < 8; i++) {
-		s[i] = u_light_position[i] - position;
-		h[i] = s[i] + v;
-	}
 
 	gl_Position = u_projection_matrix * (u_view_matrix * position);
-}
\ No newline at end of file
+}
@@ -0,0 +1,13 @@
+#version 140
+
+in vec2 v_uv;
+
+uniform sampler2D u_atlas;  // Glyphs are white, coverage is in alpha
+uniform vec4 u_color;
+
+out vec4 frag_color;
+
+void main(void)
+{
+	frag_color = vec4(u_color.rgb, u_color.a * texture(u_atlas, v_uv).a);
+}
@@ -0,0 +1,14 @@
+#version 140
+
+in vec2 a_position;  // Window pixels, origin at bottom left
+in vec2 a_uv;
+
+uniform vec2 u_screen_size;
+
+out vec2 v_uv;
+
+void main(void)
+{
+	v_uv = a_uv;
+	gl_Position = vec4(a_position / u_screen_size * 2.0 - 1.0, 0.0, 1.0);
+}